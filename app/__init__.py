@@ -1,3 +1,4 @@
+import click
 from flask import Flask
 from flask_login import LoginManager
 import os
@@ -12,6 +13,13 @@ def create_app():
                 static_folder='static')
     app.config.from_object(Config)
 
+    from app.serialization import FastJSONProvider
+    app.json = FastJSONProvider(app)
+
+    if Config.TRUSTED_PROXIES:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=Config.TRUSTED_PROXIES, x_proto=Config.TRUSTED_PROXIES)
+
     login_manager = LoginManager()
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
@@ -34,10 +42,78 @@ def create_app():
     app.register_blueprint(projects_bp)
     app.register_blueprint(tasks_bp)
 
+    from app.fragments import cached_fragment, data_version
+    app.jinja_env.globals.update(cached_fragment=cached_fragment, data_version=data_version)
+
+    if Config.SESSION_BACKEND != 'cookie':
+        from app.sessions import ServerSessionInterface
+        app.session_interface = ServerSessionInterface()
+
     @login_manager.user_loader
     def load_user_callback(user_id):
-        from app.models import load_user
-        return load_user(user_id)
+        from app.sessions import load_session_user
+        return load_session_user(user_id)
+
+    @app.cli.command('migrate-to-sqlite')
+    def migrate_to_sqlite_command():
+        from app.storage import migrate_json_to_sqlite
+        counts = migrate_json_to_sqlite()
+        for name, count in counts.items():
+            print(f"{name}: перенесено записей - {count}")
+        print(f"База данных SQLite: {Config.SQLITE_DB}")
+        print("Для переключения установите STORAGE_BACKEND=sqlite")
+
+    @app.cli.command('migrate-dates')
+    def migrate_dates_command():
+        from app.storage import migrate_date_ordinals
+        for name, count in migrate_date_ordinals().items():
+            print(f"{name}: обновлено записей - {count}")
+
+    @app.cli.command('migrate-task-history')
+    def migrate_task_history_command():
+        from app.history import migrate_task_history
+        print(f"Перенесено записей истории: {migrate_task_history()}")
+
+    @app.cli.command('purge-sessions')
+    def purge_sessions_command():
+        from app.sessions import purge_sessions
+        print(f"Удалено просроченных сессий: {purge_sessions()}")
+
+    @app.cli.command('purge-tokens')
+    def purge_tokens_command():
+        from app.utils import purge_tokens
+        print(f"Удалено использованных и просроченных токенов: {purge_tokens()}")
+
+    @app.cli.command('export-data')
+    @click.argument('kind', type=click.Choice(['projects', 'tasks']))
+    @click.option('--format', 'fmt', type=click.Choice(['jsonl', 'csv']), default='jsonl')
+    @click.option('--output', type=click.File('w', encoding='utf-8'), default='-')
+    def export_data_command(kind, fmt, output):
+        from app.transfer import export_records
+        for chunk in export_records(kind, fmt):
+            output.write(chunk)
+
+    @app.cli.command('import-data')
+    @click.argument('kind', type=click.Choice(['projects', 'tasks']))
+    @click.argument('source', type=click.File('rb'))
+    @click.option('--format', 'fmt', type=click.Choice(['jsonl', 'csv']), default='jsonl')
+    def import_data_command(kind, source, fmt):
+        from app.transfer import import_records, ImportFailed
+        try:
+            count = import_records(kind, fmt, source)
+        except ImportFailed as e:
+            for error in e.errors:
+                print(f"Строка {error['line']}: {error['error']}")
+            raise SystemExit(1)
+        print(f"Импортировано записей: {count}")
+
+    @app.cli.command('gc-attachments')
+    def gc_attachments_command():
+        from app.uploads import collect_garbage, purge_expired_sessions
+        sessions = purge_expired_sessions()
+        removed, freed = collect_garbage()
+        print(f"Удалено просроченных сессий загрузки: {sessions}")
+        print(f"Удалено неиспользуемых файлов: {removed} ({freed} байт)")
 
     @app.route('/generate_token', methods=['POST'])
     def generate_token_route():
@@ -0,0 +1,383 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from config import Config
+from app.serialization import dumps, loads
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+app_config = Config()
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _new_generation():
+    return int.from_bytes(os.urandom(6), 'big')
+
+
+def _encode_ops(ops):
+    return b''.join(dumps(op) + b'\n' for op in ops)
+
+
+class JsonBackend:
+    # A JSON snapshot (the original file) plus an append-only journal of
+    # put/delete operations. Writers hold an exclusive flock on <file>.lock,
+    # append to the journal and periodically fold it back into the snapshot
+    # with an atomic rename. Readers replay only the new tail of the journal.
+    # Compaction moves the folded journal to <file>.journal.prev and leaves
+    # a note in <file>.compacted naming the snapshot it was folded into, so
+    # a reader that was on the previous snapshot replays the rest of the old
+    # journal and adopts the new snapshot without reloading it.
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.journal_path = file_path + '.journal'
+        self.compacted_path = file_path + '.compacted'
+        self.previous_journal_path = file_path + '.journal.prev'
+        self.lock_path = file_path + '.lock'
+        self._lock_file = None
+        self._lock_pid = None
+        self._lock_depth = 0
+        self._stamp = None
+        self._journal_offset = 0
+        self._journal_ops = 0
+
+    @contextmanager
+    def lock(self, exclusive):
+        if fcntl is None or self._lock_depth:
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+            return
+        if self._lock_pid != os.getpid():
+            # flock is tied to the open file description, so a handle
+            # inherited through fork would be shared with the parent.
+            os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+            self._lock_file = open(self.lock_path, 'a')
+            self._lock_pid = os.getpid()
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        self._lock_depth += 1
+        try:
+            yield
+        finally:
+            self._lock_depth -= 1
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _journal_size(self):
+        try:
+            return os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            return 0
+
+    def exists(self):
+        return os.path.exists(self.file_path) or os.path.exists(self.journal_path)
+
+    def stale(self):
+        return _stat(self.file_path) != self._stamp or self._journal_size() != self._journal_offset
+
+    def read_changes(self):
+        records = None
+        stamp = _stat(self.file_path)
+        ops = self._catch_up(stamp) if stamp != self._stamp and stamp is not None else None
+        if ops is not None:
+            self._stamp = stamp
+            self._journal_offset = 0
+            self._journal_ops = 0
+        elif stamp != self._stamp or self._journal_size() < self._journal_offset:
+            records = []
+            if stamp is not None:
+                with open(self.file_path, 'rb') as f:
+                    records = loads(f.read())
+            self._stamp = stamp
+            self._journal_offset = 0
+            self._journal_ops = 0
+        ops = (ops or []) + self._read_journal(self.journal_path, self._journal_offset)
+        return records, ops
+
+    def _read_journal(self, path, offset, end=None):
+        # Complete lines from offset on; advances the reader's position.
+        ops = []
+        if not os.path.exists(path):
+            return ops
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n') or (end is not None and offset >= end):
+                    break
+                offset += len(line)
+                self._journal_offset += len(line)
+                self._journal_ops += 1
+                ops.append(loads(line))
+        return ops
+
+    def _catch_up(self, stamp):
+        # The ops that bring a reader from its position on the previous
+        # snapshot to the snapshot at stamp, or None when stamp was not
+        # compacted from that snapshot and the reader has to reload.
+        try:
+            with open(self.compacted_path, 'rb') as f:
+                note = loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+        if (note.get('stamp') != list(stamp) or note.get('base_stamp') != (list(self._stamp) if self._stamp else None)
+                or note.get('base_offset', -1) < self._journal_offset):
+            return None
+        ops = self._read_journal(self.previous_journal_path, self._journal_offset, note['base_offset'])
+        if self._journal_offset != note['base_offset']:
+            return None
+        return ops
+
+    def append(self, ops):
+        data = _encode_ops(ops)
+        with open(self.journal_path, 'ab') as f:
+            if f.tell() != self._journal_offset:
+                f.truncate(self._journal_offset)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_offset += len(data)
+        self._journal_ops += len(ops)
+
+    def revision(self):
+        return '%s-%d' % ('-'.join(map(str, self._stamp or ())), self._journal_offset)
+
+    def should_compact(self):
+        return self._journal_ops >= app_config.JOURNAL_COMPACT_OPS
+
+    def compact(self, records):
+        if not self._journal_ops:
+            return
+        note = {'base_stamp': list(self._stamp) if self._stamp else None, 'base_offset': self._journal_offset}
+        self._write_snapshot(records)
+        if os.path.exists(self.journal_path):
+            os.replace(self.journal_path, self.previous_journal_path)
+        self._reset_position()
+        note['stamp'] = list(self._stamp)
+        tmp_path = '%s.tmp.%d' % (self.compacted_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(dumps(note))
+        os.replace(tmp_path, self.compacted_path)
+
+    def replace(self, records):
+        for path in (self.compacted_path, self.previous_journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._write_snapshot(records)
+        if os.path.exists(self.journal_path):
+            os.truncate(self.journal_path, 0)
+        self._reset_position()
+
+    def _write_snapshot(self, records):
+        tmp_path = '%s.tmp.%d' % (self.file_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(dumps(list(records), pretty=app_config.JSON_STORAGE_FORMAT == 'pretty'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.file_path)
+
+    def _reset_position(self):
+        self._stamp = _stat(self.file_path)
+        self._journal_offset = 0
+        self._journal_ops = 0
+
+    def drop(self):
+        for path in (self.file_path, self.journal_path, self.compacted_path, self.previous_journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._stamp = None
+        self._journal_offset = 0
+        self._journal_ops = 0
+
+
+_connections = threading.local()
+
+
+def get_connection(db_path):
+    # One connection per thread and database file, reopened after fork.
+    pool = getattr(_connections, 'pool', None)
+    if pool is None or _connections.pid != os.getpid():
+        pool = _connections.pool = {}
+        _connections.transactions = {}
+        _connections.pid = os.getpid()
+    conn = pool.get(db_path)
+    if conn is None:
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('''CREATE TABLE IF NOT EXISTS collections (
+            name TEXT PRIMARY KEY,
+            generation INTEGER NOT NULL DEFAULT 0,
+            last_seq INTEGER NOT NULL DEFAULT 0,
+            base_seq INTEGER NOT NULL DEFAULT 0)''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            collection TEXT NOT NULL,
+            record_id TEXT,
+            op TEXT NOT NULL)''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_changes_collection ON changes (collection, seq)')
+        pool[db_path] = conn
+    return conn
+
+
+def _transaction_state(db_path):
+    # All collections of a thread share its connection, so the open
+    # transaction and the backends written in it are tracked per connection.
+    get_connection(db_path)
+    state = _connections.transactions.get(db_path)
+    if state is None:
+        state = _connections.transactions[db_path] = {'depth': 0, 'written': set()}
+    return state
+
+
+class SqliteBackend:
+    # Each collection is a table of JSON documents keyed by id. Queries are
+    # answered by the in-memory Collection and its indexes, so the table
+    # only has to load and persist records. Every write is logged in the
+    # shared changes table so other workers can refresh their caches
+    # incrementally.
+
+    def __init__(self, db_path, name):
+        self.db_path = db_path
+        self.name = name
+        self._generation = None
+        self._seq = 0
+        self._ops_since_compact = 0
+        self._ensure_table()
+
+    @property
+    def conn(self):
+        return get_connection(self.db_path)
+
+    def _ensure_table(self):
+        self.conn.execute('CREATE TABLE IF NOT EXISTS "%s" (id TEXT PRIMARY KEY, data TEXT NOT NULL)' % self.name)
+
+    @contextmanager
+    def lock(self, exclusive):
+        # Re-entrant per connection: a read of another collection inside an
+        # open transaction joins it instead of starting a new one.
+        state = _transaction_state(self.db_path)
+        if state['depth']:
+            state['depth'] += 1
+            try:
+                yield
+            finally:
+                state['depth'] -= 1
+            return
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE' if exclusive else 'BEGIN')
+        state['depth'] = 1
+        try:
+            yield
+            conn.execute('COMMIT')
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            # Collections written in the transaction already applied the
+            # changes in memory; make them reload from the database.
+            for backend in state['written']:
+                backend._generation = None
+            raise
+        finally:
+            state['depth'] = 0
+            state['written'].clear()
+
+    def _state(self):
+        row = self.conn.execute('SELECT generation, last_seq, base_seq FROM collections WHERE name = ?', (self.name,)).fetchone()
+        return row or (None, 0, 0)
+
+    def exists(self):
+        return self._state()[0] is not None
+
+    def stale(self):
+        generation, last_seq, _ = self._state()
+        return generation != self._generation or last_seq != self._seq
+
+    def read_changes(self):
+        conn = self.conn
+        generation, last_seq, base_seq = self._state()
+        records = None
+        if generation != self._generation or self._seq < base_seq:
+            records = [loads(row[0]) for row in conn.execute('SELECT data FROM "%s" ORDER BY rowid' % self.name)]
+            self._generation = generation
+            self._seq = last_seq
+            return records, []
+        ops = []
+        rows = conn.execute('''SELECT c.seq, c.op, c.record_id, t.data FROM changes c
+            LEFT JOIN "%s" t ON t.id = c.record_id
+            WHERE c.collection = ? AND c.seq > ? ORDER BY c.seq''' % self.name, (self.name, self._seq))
+        for seq, op, record_id, data in rows:
+            if op == 'put' and data is not None:
+                ops.append({'op': 'put', 'record': loads(data)})
+            else:
+                ops.append({'op': 'delete', 'id': record_id})
+            self._seq = seq
+        self._seq = max(self._seq, last_seq)
+        return records, ops
+
+    def _write_records(self, records):
+        self.conn.executemany('INSERT INTO "%s" (id, data) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET data = excluded.data'
+                              % self.name, [(r.get('id'), dumps(r).decode('utf-8')) for r in records])
+
+    def append(self, ops):
+        conn = self.conn
+        _transaction_state(self.db_path)['written'].add(self)
+        if not self.exists():
+            self._generation = _new_generation()
+            conn.execute('INSERT INTO collections (name, generation) VALUES (?, ?)', (self.name, self._generation))
+        self._write_records([op['record'] for op in ops if op['op'] == 'put'])
+        deleted = [(op['id'],) for op in ops if op['op'] == 'delete']
+        conn.executemany('DELETE FROM "%s" WHERE id = ?' % self.name, deleted)
+        conn.executemany('INSERT INTO changes (collection, record_id, op) VALUES (?, ?, ?)',
+                         [(self.name, op['record'].get('id') if op['op'] == 'put' else op['id'], op['op']) for op in ops])
+        seq = conn.execute('SELECT MAX(seq) FROM changes').fetchone()[0]
+        conn.execute('UPDATE collections SET last_seq = ? WHERE name = ?', (seq, self.name))
+        self._seq = seq
+        self._ops_since_compact += len(ops)
+
+    def revision(self):
+        return '%s-%d' % (self._generation, self._seq)
+
+    def should_compact(self):
+        return self._ops_since_compact >= app_config.JOURNAL_COMPACT_OPS
+
+    def compact(self, records):
+        # Workers that are further behind than the purged changes fall back
+        # to a full reload (see read_changes).
+        self.conn.execute('DELETE FROM changes WHERE collection = ? AND seq <= ?', (self.name, self._seq))
+        self.conn.execute('UPDATE collections SET base_seq = ? WHERE name = ?', (self._seq, self.name))
+        self._ops_since_compact = 0
+
+    def replace(self, records):
+        conn = self.conn
+        generation = _new_generation()
+        conn.execute('DELETE FROM "%s"' % self.name)
+        self._write_records(list(records))
+        conn.execute('DELETE FROM changes WHERE collection = ?', (self.name,))
+        conn.execute('''INSERT INTO collections (name, generation, last_seq, base_seq) VALUES (?, ?, 0, 0)
+            ON CONFLICT(name) DO UPDATE SET generation = excluded.generation, last_seq = 0, base_seq = 0''',
+            (self.name, generation))
+        self._generation = generation
+        self._seq = 0
+        self._ops_since_compact = 0
+
+    def drop(self):
+        conn = self.conn
+        conn.execute('DELETE FROM "%s"' % self.name)
+        conn.execute('DELETE FROM changes WHERE collection = ?', (self.name,))
+        conn.execute('DELETE FROM collections WHERE name = ?', (self.name,))
+        self._generation = None
+        self._seq = 0
+        self._ops_since_compact = 0
@@ -0,0 +1,53 @@
+from datetime import date
+from functools import lru_cache
+
+TASK_DATE_FIELDS = ['created_at', 'start_date', 'deadline', 'completion_date']
+PROJECT_DATE_FIELDS = ['start_date', 'end_date', 'last_activity']
+# Stands in for a missing date where ordinals are sorted; it is larger than
+# any real ordinal, so undated records sort last.
+NO_DATE = 10 ** 7
+
+
+def parse_date(value):
+    # Accepts the layouts the app stores: YYYY-MM-DD from date inputs and
+    # DD/MM/YYYY or DD.MM.YYYY, optionally followed by a time.
+    if not value or not isinstance(value, str):
+        return None
+    value = value.split(' ')[0]
+    try:
+        if '-' in value:
+            year, month, day = value.split('-')
+        elif '/' in value:
+            day, month, year = value.split('/')
+        elif '.' in value:
+            day, month, year = value.split('.')
+        else:
+            return None
+        return date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def _ordinal(value):
+    parsed = parse_date(value)
+    return parsed.toordinal() if parsed else None
+
+
+def date_ordinal(value):
+    if not value or not isinstance(value, str):
+        return None
+    return _ordinal(value)
+
+
+def add_date_ordinals(record, fields):
+    # Stores <field>_ord next to each display date so sorting and range
+    # checks compare integers.
+    for field in fields:
+        if field in record:
+            record[field + '_ord'] = date_ordinal(record[field])
+
+
+def needs_date_ordinals(record, fields):
+    return any(field + '_ord' not in record or record[field + '_ord'] != date_ordinal(record[field])
+               for field in fields if field in record)
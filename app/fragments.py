@@ -0,0 +1,67 @@
+import sys
+import threading
+from collections import OrderedDict
+from markupsafe import Markup
+from flask_login import current_user
+from config import Config
+from app.storage import db
+
+app_config = Config()
+
+
+class FragmentCache:
+    # Rendered template fragments, least recently used first out, bounded
+    # both by entry count and by the memory their strings take.
+
+    def __init__(self, maxsize, max_bytes):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        size = sys.getsizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= sys.getsizeof(previous)
+            self._entries[key] = value
+            self._bytes += size
+            while len(self._entries) > self.maxsize or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= sys.getsizeof(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+fragment_cache = FragmentCache(app_config.FRAGMENT_CACHE_SIZE, app_config.FRAGMENT_CACHE_MAX_BYTES)
+
+
+def data_version(name):
+    return getattr(db, name).version
+
+
+def cached_fragment(name, *key, shared=False, caller=None):
+    # Used as {% call cached_fragment('block', <versions>...) %}. The key must
+    # include the versions of all data the block renders; the viewer's role
+    # is always part of it and so is the user id unless shared is set.
+    user = (current_user.role,) if shared else (current_user.role, current_user.id)
+    cache_key = (name, user) + key
+    value = fragment_cache.get(cache_key)
+    if value is None:
+        value = str(caller())
+        fragment_cache.set(cache_key, value)
+    return Markup(value)
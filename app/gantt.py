@@ -0,0 +1,115 @@
+import threading
+from collections import OrderedDict
+from datetime import date
+from app.storage import db
+from app.utils import make_etag
+
+GANTT_ZOOMS = ['day', 'week', 'month', 'year']
+ZOOM_UNITS = {'day': 'day', 'week': 'week', 'month': 'month', 'year': 'quarter'}
+GANTT_CACHE_SIZE = 64
+RANGE_PADDING_BEFORE = 3
+RANGE_PADDING_AFTER = 7
+MONTH_LABELS = ['янв.', 'февр.', 'март', 'апр.', 'май', 'июнь', 'июль', 'авг.', 'сент.', 'окт.', 'нояб.', 'дек.']
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def gantt_version(project_id):
+    # Changes only when something the chart shows changes: the project, its
+    # tasks, the names of their assignees or the current day.
+    project = db.projects.get_by_id(project_id) or {}
+    tasks = db.tasks.lookup('project_id', project_id)
+    assignees = db.users.get_many(t.get('assignee_id') for t in tasks)
+    return make_etag(project_id, project.get('rev'), sorted((t['id'], t.get('rev')) for t in tasks),
+                     sorted((u['id'], u.get('rev')) for u in assignees), date.today().toordinal())
+
+
+def _month_index(day):
+    return day.year * 12 + day.month - 1
+
+
+def _bucket(unit, ordinal):
+    # Index of the column that contains the day; weeks start on Monday
+    # (ordinal 1 is a Monday).
+    if unit == 'day':
+        return ordinal
+    if unit == 'week':
+        return (ordinal - 1) // 7
+    day = date.fromordinal(ordinal)
+    if unit == 'month':
+        return _month_index(day)
+    return day.year * 4 + (day.month - 1) // 3
+
+
+def _column(unit, bucket, today_bucket):
+    weekend = False
+    if unit == 'day':
+        day = date.fromordinal(bucket)
+        label = day.day
+        weekend = day.weekday() >= 5
+    elif unit == 'week':
+        label = date.fromordinal(bucket * 7 + 1).strftime('%d.%m')
+    elif unit == 'month':
+        label = MONTH_LABELS[bucket % 12]
+    else:
+        label = '%d кв. %d' % (bucket % 4 + 1, bucket // 4)
+    return {'label': label, 'today': bucket == today_bucket, 'weekend': weekend}
+
+
+def build_gantt(project_id, zoom):
+    # Bars are returned in column units: 'offset' is the index of the first
+    # column and 'span' the number of columns the bar covers.
+    spans = []
+    for task in db.tasks.lookup('project_id', project_id):
+        start = task.get('start_date_ord') or task.get('created_at_ord')
+        end = task.get('deadline_ord')
+        spans.append((task, start, end))
+
+    dated = [(start, end) for _, start, end in spans if start and end]
+    if not dated:
+        return {'zoom': zoom, 'unit': None, 'start': None, 'end': None, 'columns': [], 'tasks': [],
+                'task_count': len(spans)}
+
+    first = min(start for start, _ in dated) - RANGE_PADDING_BEFORE
+    last = max(end for _, end in dated) + RANGE_PADDING_AFTER
+    today = date.today().toordinal()
+
+    unit = ZOOM_UNITS[zoom]
+    base = _bucket(unit, first)
+    today_bucket = _bucket(unit, today)
+    columns = [_column(unit, bucket, today_bucket) for bucket in range(base, _bucket(unit, last) + 1)]
+    position = lambda ordinal: _bucket(unit, ordinal) - base
+
+    assignee_names = {u['id']: u.get('name', u.get('username', ''))
+                      for u in db.users.get_many(t.get('assignee_id') for t, _, _ in spans)}
+    bars = []
+    for task, start, end in spans:
+        if not start or not end:
+            continue
+        offset = position(start)
+        bars.append({
+            'id': task['id'],
+            'title': task.get('title'),
+            'status': task.get('status'),
+            'assignee_name': assignee_names.get(task.get('assignee_id'), 'Не назначен'),
+            'offset': offset,
+            'span': max(position(end) - offset + 1, 1),
+        })
+
+    return {'zoom': zoom, 'unit': unit, 'start': first, 'end': last, 'columns': columns, 'tasks': bars,
+            'task_count': len(spans)}
+
+
+def get_gantt(project_id, zoom):
+    key = (gantt_version(project_id), zoom)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    data = build_gantt(project_id, zoom)
+    with _cache_lock:
+        _cache[key] = data
+        while len(_cache) > GANTT_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return data
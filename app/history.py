@@ -0,0 +1,120 @@
+import os
+import threading
+from config import Config
+from app.storage import db
+from app.serialization import dumps, loads
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+app_config = Config()
+
+HISTORY_PAGE_SIZE = 50
+
+
+class HistoryLog:
+    # Append-only JSONL log of task events. Each worker keeps an index of
+    # line offsets per task and extends it by scanning only the bytes
+    # appended since its last look, so reading one task's history touches
+    # just that task's lines.
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._offsets = {}
+        self._scanned = 0
+        self._inode = None
+
+    def _reset(self, inode=None):
+        self._offsets = {}
+        self._scanned = 0
+        self._inode = inode
+
+    def _refresh(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset()
+            return
+        if st.st_ino != self._inode or st.st_size < self._scanned:
+            self._reset(st.st_ino)
+        if st.st_size == self._scanned:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._scanned)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                task_id = loads(line).get('task_id')
+                self._offsets.setdefault(task_id, []).append(self._scanned)
+                self._scanned += len(line)
+
+    def append(self, events):
+        if not events:
+            return
+        data = b''.join(dumps(e) + b'\n' for e in events)
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'ab') as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                self._refresh()
+                if f.tell() != self._scanned:
+                    # Drop the torn tail left by a writer that died mid-line.
+                    f.truncate(self._scanned)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._refresh()
+
+    def count(self, task_id):
+        with self._lock:
+            self._refresh()
+            return len(self._offsets.get(task_id, ()))
+
+    def read(self, task_id, offset=0, limit=HISTORY_PAGE_SIZE):
+        with self._lock:
+            self._refresh()
+            offsets = self._offsets.get(task_id, [])
+            page = offsets[offset:] if limit is None else offsets[offset:offset + limit]
+            entries = []
+            if page:
+                with open(self.path, 'rb') as f:
+                    for position in page:
+                        f.seek(position)
+                        entry = loads(f.readline())
+                        entry.pop('task_id', None)
+                        entries.append(entry)
+            return entries, len(offsets)
+
+    def drop(self):
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self._reset()
+
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def get_history_log():
+    path = os.path.abspath(app_config.TASK_HISTORY_LOG)
+    with _logs_lock:
+        log = _logs.get(path)
+        if log is None:
+            log = _logs[path] = HistoryLog(path)
+        return log
+
+
+def migrate_task_history():
+    # Moves history embedded in task records (the old layout) into the log.
+    events = []
+    with db.tasks.transaction() as tx:
+        for task in db.tasks.filter(lambda t: 'history' in t):
+            events.extend(dict(entry, task_id=task['id']) for entry in task['history'])
+            tx.modify(task['id'], lambda record: record.pop('history', None))
+        get_history_log().append(events)
+    return len(events)
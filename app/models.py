@@ -1,38 +1,72 @@
-from flask_login import UserMixin
-import json
-import os
+import threading
+import time
 from config import Config
+from app.storage import db, load_data, save_data
 
 app_config = Config()
 
-def load_data(file_path):
-    if not os.path.exists(file_path):
-        return []
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+class User:
+    # Implements the Flask-Login user interface directly (instead of
+    # UserMixin) so instances can use __slots__ and stay small in the cache.
+    __slots__ = ('id', 'username', 'name', 'role', 'token')
 
-def save_data(file_path, data):
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
 
-class User(UserMixin):
     def __init__(self, id, username, name, role, token=None):
         self.id = id
         self.username = username
         self.name = name
         self.role = role
         self.token = token
-        
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        if isinstance(other, User):
+            return self.get_id() == other.get_id()
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return NotImplemented
+        return not equal
+
+    def __hash__(self):
+        # Defining __eq__ would otherwise leave the class unhashable.
+        return hash(self.get_id())
+
     def get_projects(self):
-        users = load_data(app_config.USERS_DB)
-        user = next((u for u in users if u['id'] == self.id), None)
+        user = db.users.get_by_id(self.id)
         if user and 'projects' in user:
             return user['projects']
         return []
 
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+
+def evict_user(user_id):
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
 def load_user(user_id):
-    users = load_data(app_config.USERS_DB)
-    user = next((u for u in users if u['id'] == user_id), None)
-    if user:
-        return User(user['id'], user['username'], user['name'], user['role'], user.get('token'))
-    return None
+    now = time.monotonic()
+    cached = _user_cache.get(user_id)
+    if cached and now - cached[2] < app_config.USER_CACHE_TTL:
+        return cached[0]
+
+    user = db.users.get_by_id(user_id)
+    if not user:
+        evict_user(user_id)
+        return None
+
+    if cached and cached[1] is user:
+        user_obj = cached[0]
+    else:
+        user_obj = User(user['id'], user['username'], user['name'], user['role'], user.get('token'))
+    with _user_cache_lock:
+        _user_cache[user_id] = (user_obj, user, now)
+    return user_obj
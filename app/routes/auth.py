@@ -1,8 +1,11 @@
 from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from app.models import User, load_user
-from app.utils import load_data, save_data, init_database, validate_token, mark_token_as_used, get_available_roles, load_directions, save_directions
+from werkzeug.security import check_password_hash
+from app.models import User, load_user, evict_user
+from app.storage import db
+from app.sessions import revoke_user_sessions, refresh_user_sessions
+from app.security import hash_password, password_needs_rehash, login_attempt_keys, login_retry_after, record_login_failure, clear_login_failures
+from app.utils import init_database, validate_token, mark_token_as_used, get_available_roles, get_visible_projects, load_directions, add_team_member
 import uuid
 from datetime import datetime
 from config import Config
@@ -27,37 +30,30 @@ def register():
             flash('Неверный или использованный токен')
             return render_template('register.html', roles=get_available_roles())
         
-        users = load_data(app_config.USERS_DB)
-        if any(user['username'] == username for user in users):
+        if db.users.count('username', username):
             flash('Пользователь с таким логином уже существует')
             return render_template('register.html', roles=get_available_roles())
         
+        if not mark_token_as_used(token):
+            flash('Неверный или использованный токен')
+            return render_template('register.html', roles=get_available_roles())
+        
         display_token = str(uuid.uuid4())[:8].upper()
         new_user = {
             "id": str(uuid.uuid4())[:8],
             "username": username,
-            "password": generate_password_hash(password),
+            "password": hash_password(password),
             "name": name,
             "role": token_info['role'],
             "token": display_token,
             "projects": []
         }
         
-        users.append(new_user)
-        save_data(app_config.USERS_DB, users)
+        db.users.insert(new_user)
+        evict_user(new_user['id'])
         
         if token_info['role'] == 'worker' and token_info['project_id']:
-            projects = load_data(app_config.PROJECTS_DB)
-            for project in projects:
-                if project['id'] == token_info['project_id']:
-                    team = project.get('team', [])
-                    if new_user['id'] not in team:
-                        team.append(new_user['id'])
-                        project['team'] = team
-                    break
-            save_data(app_config.PROJECTS_DB, projects)
-        
-        mark_token_as_used(token)
+            add_team_member(token_info['project_id'], new_user['id'])
         
         flash('Пользователь успешно зарегистрирован')
         
@@ -78,19 +74,24 @@ def login():
         username = request.form['username']
         password = request.form['password']
         
-        users = load_data(app_config.USERS_DB)
-        
-        if not users:
+        if not db.users.count():
             flash('База данных пользователей пуста. Обратитесь к администратору.')
             return render_template('login.html')
         
-        user = None
-        for u in users:
-            if u['username'] == username:
-                user = u
-                break
+        found = db.users.lookup('username', username)
+        user = found[0] if found else None
+        
+        # Throttled attempts are refused before any hashing is done.
+        attempt_keys = login_attempt_keys(user['username'] if user else None, request.remote_addr or '')
+        retry_after = login_retry_after(attempt_keys)
+        if retry_after:
+            flash(f'Слишком много попыток входа. Повторите через {retry_after} с.')
+            return render_template('login.html'), 429, {'Retry-After': str(retry_after)}
         
         if user and check_password_hash(user['password'], password):
+            clear_login_failures(attempt_keys)
+            if password_needs_rehash(user['password']):
+                db.users.update(user['id'], {'password': hash_password(password)})
             user_id = user.get('id', str(uuid.uuid4())[:8])
             username = user.get('username', 'unknown')
             name = user.get('name', username)
@@ -102,6 +103,7 @@ def login():
             flash(f'Добро пожаловать, {name}!')
             return redirect(url_for('dashboard.dashboard'))
         else:
+            record_login_failure(attempt_keys)
             flash('Неверный логин или пароль')
     
     return render_template('login.html')
@@ -117,18 +119,8 @@ def logout():
 @auth_bp.route('/profile')
 @login_required
 def profile():
-    users = load_data(app_config.USERS_DB)
-    user_data = next((u for u in users if u['id'] == current_user.id), None)
-    projects = load_data(app_config.PROJECTS_DB)
-    
-    if current_user.role == 'admin':
-        visible_projects = projects
-    elif current_user.role == 'manager':
-        visible_projects = [p for p in projects if p.get('manager_id', '') == current_user.id or p.get('supervisor_id', '') == current_user.id]
-    elif current_user.role == 'supervisor':
-        visible_projects = [p for p in projects if p.get('supervisor_id', '') == current_user.id]
-    else:
-        visible_projects = [p for p in projects if current_user.id in p.get('team', [])]
+    user_data = db.users.get_by_id(current_user.id)
+    visible_projects = get_visible_projects()
     
     return render_template('profile.html', user_data=user_data, projects=visible_projects)
 
@@ -140,7 +132,7 @@ def admin_users():
         flash('У вас нет доступа к этой странице')
         return redirect(url_for('dashboard.dashboard'))
     
-    users = load_data(app_config.USERS_DB)
+    users = db.users.all()
     return render_template('admin_users.html', users=users)
 
 
@@ -166,10 +158,8 @@ def add_direction():
         flash('Название направления не может быть пустым')
         return redirect(url_for('auth.admin_directions'))
     
-    directions = load_directions()
     new_id = str(uuid.uuid4())[:8]
-    directions.append({'id': new_id, 'name': name})
-    save_directions(directions)
+    db.directions.insert({'id': new_id, 'name': name})
     
     flash('Направление успешно добавлено')
     return redirect(url_for('auth.admin_directions'))
@@ -181,9 +171,7 @@ def delete_direction(direction_id):
     if current_user.role != 'admin':
         return jsonify({'error': 'Нет доступа'}), 403
     
-    directions = load_directions()
-    directions = [d for d in directions if d['id'] != direction_id]
-    save_directions(directions)
+    db.directions.delete(direction_id)
     
     flash('Направление успешно удалено')
     return redirect(url_for('auth.admin_directions'))
@@ -196,26 +184,29 @@ def edit_user(user_id):
         flash('У вас нет доступа к этой странице')
         return redirect(url_for('dashboard.dashboard'))
     
-    users = load_data(app_config.USERS_DB)
-    user = next((u for u in users if u['id'] == user_id), None)
+    user = db.users.get_by_id(user_id)
     
     if not user:
         flash('Пользователь не найден')
         return redirect(url_for('auth.admin_users'))
     
     if request.method == 'POST':
-        user['name'] = request.form['name'].strip()
-        user['role'] = request.form['role']
+        changes = {
+            'name': request.form['name'].strip(),
+            'role': request.form['role']
+        }
         
         if request.form['password']:
-            user['password'] = generate_password_hash(request.form['password'])
+            changes['password'] = hash_password(request.form['password'])
         
-        for i, u in enumerate(users):
-            if u['id'] == user_id:
-                users[i] = user
-                break
-        
-        save_data(app_config.USERS_DB, users)
+        db.users.update(user_id, changes)
+        evict_user(user_id)
+        # A new role or password ends the user's sessions; other changes
+        # only make them pick up the new name.
+        if changes['role'] != user.get('role') or 'password' in changes:
+            revoke_user_sessions(user_id)
+        else:
+            refresh_user_sessions(user_id)
         flash('Пользователь успешно обновлен')
         return redirect(url_for('auth.admin_users'))
     
@@ -229,9 +220,7 @@ def delete_user(user_id):
         flash('У вас нет доступа к этой странице')
         return redirect(url_for('dashboard.dashboard'))
     
-    users = load_data(app_config.USERS_DB)
-    
-    user = next((u for u in users if u['id'] == user_id), None)
+    user = db.users.get_by_id(user_id)
     if not user:
         flash('Пользователь не найден')
         return redirect(url_for('auth.admin_users'))
@@ -240,8 +229,9 @@ def delete_user(user_id):
         flash('Нельзя удалить самого себя')
         return redirect(url_for('auth.admin_users'))
     
-    users = [u for u in users if u['id'] != user_id]
-    save_data(app_config.USERS_DB, users)
+    db.users.delete(user_id)
+    evict_user(user_id)
+    revoke_user_sessions(user_id)
     
     flash('Пользователь успешно удален')
     return redirect(url_for('auth.admin_users'))
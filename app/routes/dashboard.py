@@ -1,6 +1,9 @@
 from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify
 from flask_login import login_required, current_user
-from app.utils import load_data, save_data, can_access_project, get_available_roles
+from app.storage import db
+from app.stats import get_dashboard_stats
+from app.search import SEARCH_KINDS, search
+from app.utils import can_access_project, get_available_roles, get_visible_projects, get_access_context
 from config import Config
 import uuid
 from datetime import datetime
@@ -18,41 +21,49 @@ def index():
 @dashboard_bp.route('/dashboard')
 @login_required
 def dashboard():
-    projects = load_data(app_config.PROJECTS_DB)
-    tasks = load_data(app_config.TASKS_DB)
-    users = load_data(app_config.USERS_DB)
-    
-    if current_user.role == 'admin':
-        visible_projects = projects
-    elif current_user.role == 'manager':
-        visible_projects = [p for p in projects if p.get('manager_id', '') == current_user.id or p.get('supervisor_id', '') == current_user.id]
-    elif current_user.role == 'supervisor':
-        visible_projects = [p for p in projects if p.get('supervisor_id', '') == current_user.id]
-    else:
-        visible_projects = [p for p in projects if current_user.id in p.get('team', [])]
-    
-    user_tasks = []
-    if current_user.role == 'admin':
-        user_tasks = tasks
-    elif current_user.role in ['manager', 'supervisor']:
-        project_ids = [p['id'] for p in visible_projects]
-        user_tasks = [t for t in tasks if t['project_id'] in project_ids]
-    else:
-        user_tasks = [t for t in tasks if t['assignee_id'] == current_user.id]
-    
-    stats = {
-        'total_projects': len(visible_projects),
-        'active_projects': len([p for p in visible_projects if p['status'] == 'в работе']),
-        'total_tasks': len(user_tasks),
-        'active_tasks': len([t for t in user_tasks if t['status'] == 'активна']),
-        'completed_tasks': len([t for t in user_tasks if t['status'] == 'завершена'])
-    }
+    visible_projects = get_visible_projects()
+    stats = get_dashboard_stats(visible_projects)
     
     user_token = current_user.token
 
     return render_template('dashboard.html', 
                          projects=visible_projects, 
-                         tasks=user_tasks, 
-                         users=users, 
                          stats=stats,
                          user_token=user_token)
+
+
+def _search_visible():
+    context = get_access_context()
+    if context.is_admin:
+        return {'projects': None, 'tasks': None}
+    task_ids = set(context.task_ids)
+    for project_id in context.project_ids:
+        task_ids |= db.tasks.lookup_ids('project_id', project_id)
+    return {'projects': context.project_ids, 'tasks': task_ids}
+
+
+def _search_item(score, kind, record):
+    if kind == 'projects':
+        return {'type': 'project', 'id': record['id'], 'title': record.get('name'), 'status': record.get('status'),
+                'url': url_for('projects.project_detail', project_id=record['id']), 'score': round(score, 3)}
+    project = db.projects.get_by_id(record.get('project_id'))
+    return {'type': 'task', 'id': record['id'], 'title': record.get('title'), 'status': record.get('status'),
+            'project_id': record.get('project_id'), 'project_name': project.get('name') if project else None,
+            'deadline': record.get('deadline'), 'url': url_for('tasks.task_detail', task_id=record['id']),
+            'score': round(score, 3)}
+
+
+@dashboard_bp.route('/api/search', methods=['GET'])
+@login_required
+def api_search():
+    query = request.args.get('q', '').strip()
+    kind = request.args.get('type')
+    if kind and kind not in SEARCH_KINDS:
+        return jsonify({'error': 'Недопустимый тип поиска'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+    except ValueError:
+        return jsonify({'error': 'Некорректный размер страницы'}), 400
+
+    results, total = search(query, [kind] if kind else SEARCH_KINDS, _search_visible(), limit)
+    return jsonify({'query': query, 'results': [_search_item(*result) for result in results], 'total': total})
@@ -1,10 +1,12 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify
+from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
-from app.utils import load_data, save_data, can_access_project, can_access_task, load_directions
+from app.storage import db
+from app.utils import can_access_project, can_access_task, load_directions, get_user_tokens, get_access_context, make_etag, conditional_json, add_team_member, remove_team_member
+from app.gantt import GANTT_ZOOMS, gantt_version, get_gantt
+from app import transfer
 from config import Config
 import uuid
 from datetime import datetime
-from dateutil.parser import parse as parse_date
 
 app_config = Config()
 projects_bp = Blueprint('projects', __name__)
@@ -17,22 +19,19 @@ def project_detail(project_id):
         flash('У вас нет доступа к этому проекту')
         return redirect(url_for('dashboard.dashboard'))
 
-    projects = load_data(app_config.PROJECTS_DB)
-    tasks = load_data(app_config.TASKS_DB)
-    users = load_data(app_config.USERS_DB)
-
-    project = next((p for p in projects if p.get('id') == project_id), None)
+    project = db.projects.get_by_id(project_id)
     if not project:
         flash('Проект не найден')
         return redirect(url_for('dashboard.dashboard'))
 
-    project_tasks = [t for t in tasks if t.get('project_id') == project_id]
+    project_tasks = db.tasks.lookup('project_id', project_id)
+    users = db.users.all()
 
-    supervisor = next((u for u in users if u.get('id') == project.get('supervisor_id', '')), None) if project.get('supervisor_id') else None
-    manager = next((u for u in users if u.get('id') == project.get('manager_id', '')), None) if project.get('manager_id') else None
+    supervisor = db.users.get_by_id(project.get('supervisor_id')) if project.get('supervisor_id') else None
+    manager = db.users.get_by_id(project.get('manager_id')) if project.get('manager_id') else None
     team_members = []
     if project.get('team'):
-        team_members = [next((u for u in users if u.get('id') == member_id), None) for member_id in project.get('team', [])]
+        team_members = [db.users.get_by_id(member_id) for member_id in project.get('team', [])]
         team_members = [m for m in team_members if m]
 
     return render_template('project_detail.html', 
@@ -51,7 +50,7 @@ def create_project():
         flash('У вас нет прав на создание проектов')
         return redirect(url_for('dashboard.dashboard'))
 
-    users = load_data(app_config.USERS_DB)
+    users = db.users.all()
     managers = [u for u in users if u['role'] in ['admin', 'manager']]
     curators = [u for u in users if u['role'] in ['admin', 'supervisor']]
     directions = load_directions()
@@ -74,9 +73,7 @@ def create_project():
             "team": request.form.getlist('team_members'),
         }
 
-        projects = load_data(app_config.PROJECTS_DB)
-        projects.append(new_project)
-        save_data(app_config.PROJECTS_DB, projects)
+        db.projects.insert(new_project)
 
         flash('Проект успешно создан')
         return redirect(url_for('projects.project_detail', project_id=project_id))
@@ -91,8 +88,7 @@ def edit_project(project_id):
         flash('У вас нет доступа к этому проекту')
         return redirect(url_for('dashboard.dashboard'))
 
-    projects = load_data(app_config.PROJECTS_DB)
-    project = next((p for p in projects if p['id'] == project_id), None)
+    project = db.projects.get_by_id(project_id)
 
     if not project:
         flash('Проект не найден')
@@ -102,28 +98,23 @@ def edit_project(project_id):
         flash('У вас нет прав на редактирование этого проекта')
         return redirect(url_for('projects.project_detail', project_id=project_id))
 
-    users = load_data(app_config.USERS_DB)
+    users = db.users.all()
     managers = [u for u in users if u['role'] in ['admin', 'manager']]
     directions = load_directions()
 
     if request.method == 'POST':
-        project['name'] = request.form['name'].strip()
-        project['description'] = request.form['description'].strip()
-        project['direction'] = request.form['direction'].strip()
-        project['expected_result'] = request.form['expected_result'].strip()
-        project['end_date'] = request.form.get('end_date', None)
-        project['status'] = request.form.get('status', 'в работе')
-        project['supervisor_id'] = request.form.get('supervisor_id', None)
-        project['manager_id'] = request.form.get('manager_id', None)
-        project['team'] = request.form.getlist('team_members')
-        project['last_activity'] = datetime.now().strftime("%d/%m/%Y")
-
-        for i, p in enumerate(projects):
-            if p['id'] == project_id:
-                projects[i] = project
-                break
-
-        save_data(app_config.PROJECTS_DB, projects)
+        db.projects.update(project_id, {
+            'name': request.form['name'].strip(),
+            'description': request.form['description'].strip(),
+            'direction': request.form['direction'].strip(),
+            'expected_result': request.form['expected_result'].strip(),
+            'end_date': request.form.get('end_date', None),
+            'status': request.form.get('status', 'в работе'),
+            'supervisor_id': request.form.get('supervisor_id', None),
+            'manager_id': request.form.get('manager_id', None),
+            'team': request.form.getlist('team_members'),
+            'last_activity': datetime.now().strftime("%d/%m/%Y")
+        })
         flash('Проект успешно обновлен')
         return redirect(url_for('projects.project_detail', project_id=project_id))
 
@@ -136,40 +127,85 @@ def api_get_project_team(project_id):
     if not can_access_project(project_id):
         return jsonify({'error': 'У вас нет доступа к этому проекту'}), 403
 
-    projects = load_data(app_config.PROJECTS_DB)
-    users = load_data(app_config.USERS_DB)
-
-    project = next((p for p in projects if p['id'] == project_id), None)
+    project = db.projects.get_by_id(project_id)
     if not project:
         return jsonify({'error': 'Проект не найден'}), 404
 
-    team_member_ids = project.get('team', [])
+    team_member_ids = [u for u in project.get('team', []) if db.users.get_by_id(u)]
+    tokens = get_user_tokens(team_member_ids, project_id)
     team_members = []
 
     for user_id in team_member_ids:
-        user = next((u for u in users if u['id'] == user_id), None)
-        if user:
-            from app.utils import get_user_token
-            token = get_user_token(user_id, project_id)
-            team_member = {
-                'id': user['id'],
-                'token': token,
-                'role': user.get('role', ''),
-                'name': user.get('name', '')
-            }
-            team_members.append(team_member)
+        user = db.users.get_by_id(user_id)
+        team_member = {
+            'id': user['id'],
+            'token': tokens.get(user_id),
+            'role': user.get('role', ''),
+            'name': user.get('name', '')
+        }
+        team_members.append(team_member)
 
     return jsonify(team_members)
 
 
+@projects_bp.route('/api/project/<project_id>/gantt', methods=['GET'])
+@login_required
+def api_project_gantt(project_id):
+    if not can_access_project(project_id):
+        return jsonify({'error': 'У вас нет доступа к этому проекту'}), 403
+
+    if not db.projects.get_by_id(project_id):
+        return jsonify({'error': 'Проект не найден'}), 404
+
+    zoom = request.args.get('zoom', 'week')
+    if zoom not in GANTT_ZOOMS:
+        return jsonify({'error': 'Недопустимый масштаб'}), 400
+
+    return conditional_json(lambda: make_etag('gantt', zoom, gantt_version(project_id)),
+                            lambda: get_gantt(project_id, zoom))
+
+
+@projects_bp.route('/api/export/<kind>', methods=['GET'])
+@login_required
+def api_export(kind):
+    fmt = request.args.get('format', 'jsonl')
+    if kind not in transfer.EXPORT_FIELDS or fmt not in transfer.FORMATS:
+        return jsonify({'error': 'Неизвестный тип или формат выгрузки'}), 400
+
+    project_ids = None if current_user.role == 'admin' else get_access_context().project_ids
+    mimetype = 'application/x-ndjson' if fmt == 'jsonl' else 'text/csv'
+    response = Response(stream_with_context(transfer.export_records(kind, fmt, project_ids)),
+                        mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+    return response
+
+
+@projects_bp.route('/api/import/<kind>', methods=['POST'])
+@login_required
+def api_import(kind):
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Импорт доступен только администратору'}), 403
+
+    fmt = request.args.get('format', 'jsonl')
+    if kind not in transfer.EXPORT_FIELDS or fmt not in transfer.FORMATS:
+        return jsonify({'error': 'Неизвестный тип или формат загрузки'}), 400
+
+    stream = request.files['file'].stream if 'file' in request.files else request.stream
+    try:
+        count = transfer.import_records(kind, fmt, stream, current_user.id)
+    except transfer.ImportFailed as e:
+        return jsonify({'error': 'Импорт отменен: исправьте ошибки в данных', 'errors': e.errors}), 400
+
+    return jsonify({'success': True, 'imported': count})
+
+
 @projects_bp.route('/project/<project_id>/add_member', methods=['POST'])
 @login_required
 def add_project_member(project_id):
     if not can_access_project(project_id):
         return jsonify({'error': 'У вас нет доступа к этому проекту'}), 403
 
-    projects = load_data(app_config.PROJECTS_DB)
-    project = next((p for p in projects if p['id'] == project_id), None)
+    project = db.projects.get_by_id(project_id)
     if not project:
         return jsonify({'error': 'Проект не найден'}), 404
 
@@ -183,22 +219,11 @@ def add_project_member(project_id):
     if not user_id:
         return jsonify({'error': 'Не указан ID пользователя'}), 400
 
-    users = load_data(app_config.USERS_DB)
-    user = next((u for u in users if u['id'] == user_id), None)
+    user = db.users.get_by_id(user_id)
     if not user:
         return jsonify({'error': 'Пользователь не найден'}), 404
 
-    team = project.get('team', [])
-    if user_id not in team:
-        team.append(user_id)
-        project['team'] = team
-
-        for i, p in enumerate(projects):
-            if p['id'] == project_id:
-                projects[i] = project
-                break
-        save_data(app_config.PROJECTS_DB, projects)
-
+    if add_team_member(project_id, user_id):
         return jsonify({'success': True, 'message': 'Участник успешно добавлен в проект'})
     else:
         return jsonify({'error': 'Пользователь уже является участником проекта'}), 400
@@ -210,8 +235,7 @@ def remove_project_member(project_id, user_id):
     if not can_access_project(project_id):
         return jsonify({'error': 'У вас нет доступа к этому проекту'}), 403
 
-    projects = load_data(app_config.PROJECTS_DB)
-    project = next((p for p in projects if p['id'] == project_id), None)
+    project = db.projects.get_by_id(project_id)
     if not project:
         return jsonify({'error': 'Проект не найден'}), 404
 
@@ -221,22 +245,11 @@ def remove_project_member(project_id, user_id):
     if current_user.role == 'supervisor' and project.get('supervisor_id') != current_user.id:
         return jsonify({'error': 'Вы не являетесь куратором этого проекта'}), 403
 
-    users = load_data(app_config.USERS_DB)
-    user = next((u for u in users if u['id'] == user_id), None)
+    user = db.users.get_by_id(user_id)
     if not user:
         return jsonify({'error': 'Пользователь не найден'}), 404
 
-    team = project.get('team', [])
-    if user_id in team:
-        team.remove(user_id)
-        project['team'] = team
-
-        for i, p in enumerate(projects):
-            if p['id'] == project_id:
-                projects[i] = project
-                break
-        save_data(app_config.PROJECTS_DB, projects)
-
+    if remove_team_member(project_id, user_id):
         return jsonify({'success': True, 'message': 'Участник успешно удален из проекта'})
     else:
         return jsonify({'error': 'Пользователь не является участником проекта'}), 400
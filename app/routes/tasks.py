@@ -1,16 +1,113 @@
 from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify
 from flask_login import login_required, current_user
-from app.utils import load_data, save_data, can_access_project, can_access_task, add_task_history, allowed_file
+from app.storage import db
+from app.history import get_history_log, HISTORY_PAGE_SIZE
+from app.dates import NO_DATE, parse_date, date_ordinal
+from app.stats import TASK_STATUSES
+from app import uploads
+from app.utils import can_access_project, can_access_task, add_task_history, history_entry, allowed_file, get_user_tokens, get_user_token, get_access_context, encode_cursor, decode_cursor, make_etag, conditional_json
 from config import Config
 import uuid
-from datetime import datetime
-from dateutil.parser import parse as parse_date
-from werkzeug.utils import secure_filename
-import os
+from datetime import date, datetime
+import heapq
+import itertools
 
 app_config = Config()
 tasks_bp = Blueprint('tasks', __name__)
 
+TASK_SORT_FIELDS = ['deadline', 'created_at']
+TASK_LIST_FIELDS = ['id', 'project_id', 'title', 'status', 'assignee_id', 'start_date', 'deadline', 'created_at',
+                    'start_date_ord', 'deadline_ord', 'created_at_ord']
+BULK_MAX_TASKS = 500
+BULK_MAX_DEADLINE_SHIFT = 3660
+
+
+def _visible_task_ids():
+    if current_user.role == 'admin':
+        return db.tasks.ids()
+    if current_user.role in ['manager', 'supervisor']:
+        task_ids = set()
+        for project_id in get_access_context().project_ids:
+            task_ids |= db.tasks.lookup_ids('project_id', project_id)
+        return task_ids
+    return db.tasks.lookup_ids('assignee_id', current_user.id)
+
+
+def _sorted_listing(groups, sort_field, descending, position):
+    # (value, id) pairs of the groups' tasks in page order, after position.
+    # Descending pages list dated tasks first and undated ones last, the same
+    # as ascending ones.
+    index = 'list_' + sort_field
+    if not descending:
+        return heapq.merge(*[db.tasks.walk(index, group, position) for group in groups])
+    undated = position is not None and position[0] == NO_DATE
+    dated = [] if undated else [db.tasks.walk(index, group, position or (NO_DATE,), reverse=True) for group in groups]
+    rest = [db.tasks.walk(index, group, position if undated else (NO_DATE,)) for group in groups]
+    return itertools.chain(heapq.merge(*dated, reverse=True), heapq.merge(*rest))
+
+
+def _list_tasks_page(project_id, status, assignee_id, sort_field, descending, limit, deadline_from, deadline_to, position):
+    # The filters narrow a set of ids; the page is then read off the sorted
+    # listing index from the cursor, so no page sorts the whole result.
+    groups = _deadline_groups(project_id, assignee_id)
+    task_ids = _visible_task_ids()
+    if project_id:
+        task_ids &= db.tasks.lookup_ids('project_id', project_id)
+    if status:
+        task_ids &= db.tasks.lookup_ids('status', status)
+    if assignee_id:
+        task_ids &= db.tasks.lookup_ids('assignee_id', assignee_id)
+    if deadline_from is not None or deadline_to is not None:
+        high = NO_DATE - 1 if deadline_to is None else deadline_to
+        task_ids &= {task_id for group in groups
+                     for _, task_id in db.tasks.range_ids('list_deadline', group, deadline_from, high)}
+
+    page = []
+    if task_ids:
+        for item in _sorted_listing(groups, sort_field, descending, position):
+            if item[1] in task_ids:
+                page.append(item)
+                if len(page) > limit:
+                    break
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(list(page[-1]))
+
+    items = [_task_list_item(db.tasks.get_by_id(task_id)) for _, task_id in page]
+    return {'tasks': items, 'next_cursor': next_cursor, 'total': len(task_ids)}
+
+
+def _task_list_item(task):
+    item = {field: task.get(field) for field in TASK_LIST_FIELDS}
+    project = db.projects.get_by_id(task.get('project_id'))
+    item['project_name'] = project.get('name') if project else None
+    return item
+
+
+def _deadline_groups(project_id, assignee_id):
+    if project_id:
+        return [('project', project_id)]
+    if current_user.role == 'admin':
+        return [('assignee', assignee_id)] if assignee_id else [None]
+    if current_user.role in ['manager', 'supervisor']:
+        return [('project', pid) for pid in get_access_context().project_ids]
+    return [('assignee', current_user.id)]
+
+
+def _tasks_by_deadline(low, high, limit):
+    project_id = request.args.get('project_id')
+    assignee_id = request.args.get('assignee_id')
+    if project_id and not can_access_project(project_id):
+        return jsonify({'error': 'У вас нет доступа к этому проекту'}), 403
+
+    ranges = [db.tasks.range('deadline', group, low, high) for group in _deadline_groups(project_id, assignee_id)]
+    tasks = [task for _, task in heapq.merge(*ranges, key=lambda item: (item[0], item[1]['id']))
+             if (not assignee_id or task.get('assignee_id') == assignee_id) and can_access_task(task['id'])]
+    return jsonify({'tasks': [_task_list_item(task) for task in tasks[:limit]], 'total': len(tasks),
+                    'today': date.today().toordinal()})
+
 
 @tasks_bp.route('/project/<project_id>/create_task', methods=['GET', 'POST'])
 @login_required
@@ -23,35 +120,31 @@ def create_task(project_id):
         flash('У вас нет прав на создание задач')
         return redirect(url_for('projects.project_detail', project_id=project_id))
 
-    projects = load_data(app_config.PROJECTS_DB)
-    users = load_data(app_config.USERS_DB)
-
-    project = next((p for p in projects if p.get('id') == project_id), None)
+    project = db.projects.get_by_id(project_id)
     if not project:
         flash('Проект не найден')
         return redirect(url_for('dashboard.dashboard'))
 
     eligible_users = []
     if current_user.role == 'admin':
-        eligible_users = users
+        eligible_users = db.users.all()
     else:
         team_member_ids = project.get('team', []) + [project.get('manager_id')]
-        eligible_users = [u for u in users if u['id'] in team_member_ids]
+        eligible_users = db.users.get_many(team_member_ids)
 
     if request.method == 'POST':
         start_date = request.form.get('start_date', datetime.now().strftime("%d/%m/%Y"))
         deadline = request.form['deadline']
 
         if start_date and deadline:
-            try:
-                start_dt = parse_date(start_date)
-                deadline_dt = parse_date(deadline)
-                if start_dt > deadline_dt:
-                    flash('Дата начала не может быть позже даты дедлайна')
-                    return render_template('create_task.html', project=project, users=eligible_users)
-            except:
+            start_dt = parse_date(start_date)
+            deadline_dt = parse_date(deadline)
+            if not start_dt or not deadline_dt:
                 flash('Некорректный формат даты')
                 return render_template('create_task.html', project=project, users=eligible_users)
+            if start_dt > deadline_dt:
+                flash('Дата начала не может быть позже даты дедлайна')
+                return render_template('create_task.html', project=project, users=eligible_users)
 
         task = {
             "id": str(uuid.uuid4())[:8],
@@ -67,16 +160,8 @@ def create_task(project_id):
             "completion_date": ""
         }
 
-        tasks = load_data(app_config.TASKS_DB)
-        tasks.append(task)
-        save_data(app_config.TASKS_DB, tasks)
-
-        project['last_activity'] = datetime.now().strftime("%d/%m/%Y")
-        for i, p in enumerate(projects):
-            if p.get('id') == project_id:
-                projects[i] = project
-                break
-        save_data(app_config.PROJECTS_DB, projects)
+        db.tasks.insert(task)
+        db.projects.update(project_id, {'last_activity': datetime.now().strftime("%d/%m/%Y")})
 
         flash('Задача успешно создана')
         return redirect(url_for('projects.project_detail', project_id=project_id))
@@ -90,24 +175,191 @@ def api_get_tasks_by_project(project_id):
     if not can_access_project(project_id):
         return jsonify({'error': 'У вас нет доступа к этому проекту'}), 403
 
-    tasks = load_data(app_config.TASKS_DB)
-    project_tasks = [t for t in tasks if t.get('project_id') == project_id]
+    # Tokens are resolved (and created if missing) before the tag is taken,
+    # so the tag covers exactly the tokens the body will contain.
+    project_tasks = db.tasks.lookup('project_id', project_id)
+    assignees = {u['id']: u for u in db.users.get_many(t.get('assignee_id') for t in project_tasks)}
+    tokens = get_user_tokens(list(assignees), project_id)
 
-    users = load_data(app_config.USERS_DB)
-    user_map = {u['id']: u for u in users}
+    def project_tasks_etag():
+        revisions = sorted((t['id'], t.get('rev')) for t in project_tasks)
+        users = sorted((u['id'], u.get('rev')) for u in assignees.values())
+        return make_etag('project_tasks', project_id, revisions, users, sorted(tokens.items()))
 
-    for task in project_tasks:
-        assignee = user_map.get(task.get('assignee_id'))
-        if assignee:
-            from app.utils import get_user_token
-            token = get_user_token(task.get('assignee_id'), project_id)
-            task['assignee_token'] = token
-            task['assignee_name'] = assignee.get('name', assignee.get('username', ''))
-        else:
-            task['assignee_token'] = None
-            task['assignee_name'] = 'Не назначен'
+    def build():
+        result = []
+        for task in project_tasks:
+            task = dict(task)
+            assignee = assignees.get(task.get('assignee_id'))
+            if assignee:
+                task['assignee_token'] = tokens.get(task.get('assignee_id'))
+                task['assignee_name'] = assignee.get('name', assignee.get('username', ''))
+            else:
+                task['assignee_token'] = None
+                task['assignee_name'] = 'Не назначен'
+            result.append(task)
 
-    return jsonify(project_tasks)
+        return result
+
+    return conditional_json(project_tasks_etag, build)
+
+
+@tasks_bp.route('/api/tasks', methods=['GET'])
+@login_required
+def api_list_tasks():
+    project_id = request.args.get('project_id')
+    status = request.args.get('status')
+    assignee_id = request.args.get('assignee_id')
+    sort = request.args.get('sort', 'deadline')
+    descending = sort.startswith('-')
+    sort_field = sort.lstrip('-')
+
+    if sort_field not in TASK_SORT_FIELDS:
+        return jsonify({'error': 'Недопустимое поле сортировки'}), 400
+
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+    except ValueError:
+        return jsonify({'error': 'Некорректный размер страницы'}), 400
+
+    deadline_from = date_ordinal(request.args.get('deadline_from'))
+    deadline_to = date_ordinal(request.args.get('deadline_to'))
+
+    position = None
+    if request.args.get('cursor'):
+        position = decode_cursor(request.args['cursor'])
+        if not (isinstance(position, list) and len(position) == 2
+                and isinstance(position[0], int) and isinstance(position[1], str)):
+            return jsonify({'error': 'Некорректный курсор'}), 400
+        position = tuple(position)
+
+    if project_id and not can_access_project(project_id):
+        return jsonify({'error': 'У вас нет доступа к этому проекту'}), 403
+
+    def tasks_page_etag():
+        return make_etag('tasks', current_user.id, current_user.role, request.query_string, db.tasks.version, db.projects.version)
+
+    return conditional_json(tasks_page_etag, lambda: _list_tasks_page(
+        project_id, status, assignee_id, sort_field, descending, limit, deadline_from, deadline_to, position))
+
+
+@tasks_bp.route('/api/tasks/overdue', methods=['GET'])
+@login_required
+def api_overdue_tasks():
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+    except ValueError:
+        return jsonify({'error': 'Некорректный размер страницы'}), 400
+    return _tasks_by_deadline(None, date.today().toordinal() - 1, limit)
+
+
+@tasks_bp.route('/api/tasks/upcoming', methods=['GET'])
+@login_required
+def api_upcoming_tasks():
+    try:
+        days = min(max(int(request.args.get('days', 7)), 0), 366)
+        limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+    except ValueError:
+        return jsonify({'error': 'Некорректные параметры запроса'}), 400
+    today = date.today().toordinal()
+    return _tasks_by_deadline(today, today + days, limit)
+
+
+@tasks_bp.route('/api/tasks/bulk', methods=['POST'])
+@login_required
+def api_bulk_update_tasks():
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Некорректный формат запроса'}), 400
+    task_ids = data.get('task_ids') or []
+    changes = data.get('changes') or {}
+    if not isinstance(task_ids, list) or not all(isinstance(task_id, str) for task_id in task_ids):
+        return jsonify({'error': 'Некорректный список задач'}), 400
+    if not isinstance(changes, dict):
+        return jsonify({'error': 'Некорректный формат изменений'}), 400
+    task_ids = list(dict.fromkeys(task_ids))
+    new_status = changes.get('status')
+    new_assignee_id = changes.get('assignee_id')
+    deadline_shift = changes.get('deadline_shift')
+
+    if not task_ids or len(task_ids) > BULK_MAX_TASKS:
+        return jsonify({'error': f'Укажите от 1 до {BULK_MAX_TASKS} задач'}), 400
+    if new_status is None and new_assignee_id is None and not deadline_shift:
+        return jsonify({'error': 'Не указаны изменения'}), 400
+    if new_status is not None and new_status not in TASK_STATUSES:
+        return jsonify({'error': 'Недопустимый статус задачи'}), 400
+    if new_assignee_id is not None and not isinstance(new_assignee_id, str):
+        return jsonify({'error': 'Некорректный ответственный'}), 400
+    if deadline_shift is not None and (isinstance(deadline_shift, bool) or not isinstance(deadline_shift, int)
+                                       or abs(deadline_shift) > BULK_MAX_DEADLINE_SHIFT):
+        return jsonify({'error': 'Некорректный сдвиг дедлайна'}), 400
+    if (new_assignee_id is not None or deadline_shift) and current_user.role not in ['admin', 'manager', 'supervisor']:
+        return jsonify({'error': 'У вас нет прав на редактирование задач'}), 403
+    if new_assignee_id is not None and not db.users.get_by_id(new_assignee_id):
+        return jsonify({'error': 'Назначаемый пользователь не найден'}), 404
+
+    tasks = db.tasks.get_many(task_ids)
+    missing = sorted(set(task_ids) - {t['id'] for t in tasks})
+    if missing:
+        return jsonify({'error': 'Задачи не найдены', 'task_ids': missing}), 404
+
+    denied = [t['id'] for t in tasks if not can_access_task(t['id'])
+              or ((new_assignee_id is not None or deadline_shift) and not can_access_project(t.get('project_id')))]
+    if denied:
+        return jsonify({'error': 'У вас нет доступа к некоторым задачам', 'task_ids': denied}), 403
+
+    if new_assignee_id is not None:
+        outsiders = []
+        for project in db.projects.get_many({t.get('project_id') for t in tasks}):
+            if new_assignee_id not in project.get('team', []) and new_assignee_id not in (project.get('manager_id'), project.get('supervisor_id')):
+                outsiders.extend(t['id'] for t in tasks if t.get('project_id') == project['id'])
+        if outsiders:
+            return jsonify({'error': 'Назначаемый пользователь не является участником проекта', 'task_ids': outsiders}), 400
+
+    now = datetime.now().strftime("%d/%m/%Y")
+    task_changes = {}
+    for task in tasks:
+        update = {}
+        if new_assignee_id is not None and new_assignee_id != task.get('assignee_id'):
+            update['assignee_id'] = new_assignee_id
+        if deadline_shift and task.get('deadline_ord'):
+            try:
+                deadline = date.fromordinal(task['deadline_ord'] + deadline_shift)
+            except ValueError:
+                return jsonify({'error': 'Некорректный сдвиг дедлайна', 'task_ids': [task['id']]}), 400
+            start = task.get('start_date_ord')
+            if start and deadline.toordinal() < start:
+                return jsonify({'error': 'Дата начала не может быть позже даты дедлайна', 'task_ids': [task['id']]}), 400
+            update['deadline'] = deadline.strftime("%Y-%m-%d")
+        if new_status is not None and new_status != task.get('status'):
+            update['status'] = new_status
+            update['completion_date'] = now if new_status == 'завершена' else ""
+        if update:
+            task_changes[task['id']] = update
+
+    # History entries read the users collection, so they are prepared before
+    # the tasks transaction rather than inside it.
+    history = []
+    for task_id, update in task_changes.items():
+        if 'assignee_id' in update:
+            history.append(history_entry(task_id, 'Изменен ответственный', current_user.id))
+        if 'deadline' in update:
+            history.append(history_entry(task_id, 'Изменен дедлайн', current_user.id))
+        if 'status' in update:
+            history.append(history_entry(task_id, f'Изменен статус на "{new_status}"', current_user.id))
+
+    with db.tasks.transaction() as tx:
+        for task_id, update in task_changes.items():
+            tx.update(task_id, update)
+    add_task_history(history)
+
+    with db.projects.transaction() as tx:
+        for project_id in {t.get('project_id') for t in tasks if t['id'] in task_changes}:
+            tx.update(project_id, {'last_activity': now})
+
+    return jsonify({'success': True, 'updated': len(task_changes)})
 
 
 @tasks_bp.route('/task/<task_id>/update_status', methods=['POST'])
@@ -117,8 +369,7 @@ def update_task_status(task_id):
         flash('У вас нет доступа к этой задаче')
         return redirect(url_for('dashboard.dashboard'))
 
-    tasks = load_data(app_config.TASKS_DB)
-    task = next((t for t in tasks if t.get('id') == task_id), None)
+    task = db.tasks.get_by_id(task_id)
 
     if not task:
         flash('Задача не найдена')
@@ -129,29 +380,15 @@ def update_task_status(task_id):
         flash('Недопустимый статус задачи')
         return redirect(request.referrer or url_for('dashboard.dashboard'))
 
-    task['status'] = new_status
+    changes = {'status': new_status}
 
     if new_status == 'завершена' and task.get('status') != 'завершена':
-        task['completion_date'] = datetime.now().strftime("%d/%m/%Y")
+        changes['completion_date'] = datetime.now().strftime("%d/%m/%Y")
     elif new_status != 'завершена':
-        task['completion_date'] = ""
-
-    for i, t in enumerate(tasks):
-        if t.get('id') == task_id:
-            tasks[i] = task
-            break
-
-    save_data(app_config.TASKS_DB, tasks)
+        changes['completion_date'] = ""
 
-    projects = load_data(app_config.PROJECTS_DB)
-    project = next((p for p in projects if p.get('id') == task.get('project_id')), None)
-    if project:
-        project['last_activity'] = datetime.now().strftime("%d/%m/%Y")
-        for i, p in enumerate(projects):
-            if p.get('id') == project.get('id'):
-                projects[i] = project
-                break
-        save_data(app_config.PROJECTS_DB, projects)
+    db.tasks.update(task_id, changes)
+    db.projects.update(task.get('project_id'), {'last_activity': datetime.now().strftime("%d/%m/%Y")})
 
     flash('Статус задачи успешно обновлен')
     return redirect(request.referrer or url_for('dashboard.dashboard'))
@@ -163,12 +400,12 @@ def update_task(task_id):
     if not can_access_task(task_id):
         return jsonify({'error': 'У вас нет доступа к этой задаче'}), 403
 
-    tasks = load_data(app_config.TASKS_DB)
-    task = next((t for t in tasks if t.get('id') == task_id), None)
+    task = db.tasks.get_by_id(task_id)
 
     if not task:
         return jsonify({'error': 'Задача не найдена'}), 404
 
+    task = dict(task)
     project_id = task.get('project_id')
     if current_user.role not in ['admin', 'manager', 'supervisor']:
         return jsonify({'error': 'У вас нет прав на редактирование задачи'}), 403
@@ -183,83 +420,67 @@ def update_task(task_id):
     new_deadline = request.form.get('deadline')
 
     if new_start_date and new_deadline:
-        try:
-            start_dt = parse_date(new_start_date)
-            deadline_dt = parse_date(new_deadline)
-            if start_dt > deadline_dt:
-                return jsonify({'error': 'Дата начала не может быть позже даты дедлайна'}), 400
-        except:
+        start_dt = parse_date(new_start_date)
+        deadline_dt = parse_date(new_deadline)
+        if not start_dt or not deadline_dt:
             return jsonify({'error': 'Некорректный формат даты'}), 400
+        if start_dt > deadline_dt:
+            return jsonify({'error': 'Дата начала не может быть позже даты дедлайна'}), 400
 
     original_task = task.copy()
-    users = load_data(app_config.USERS_DB)
+    history = []
 
     if new_assignee_id and new_assignee_id != task.get('assignee_id'):
-        user = next((u for u in users if u['id'] == new_assignee_id), None)
+        user = db.users.get_by_id(new_assignee_id)
         if not user:
             return jsonify({'error': 'Назначаемый пользователь не найден'}), 404
 
-        projects = load_data(app_config.PROJECTS_DB)
-        project = next((p for p in projects if p['id'] == project_id), None)
+        project = db.projects.get_by_id(project_id)
         if project and new_assignee_id not in project.get('team', []) and new_assignee_id != project.get('manager_id') and new_assignee_id != project.get('supervisor_id'):
             return jsonify({'error': 'Назначаемый пользователь не является участником проекта'}), 400
 
         task['assignee_id'] = new_assignee_id
-        add_task_history(task, f'Изменен ответственный', current_user.id, users)
+        history.append(history_entry(task_id, f'Изменен ответственный', current_user.id))
 
     if new_title and new_title != task.get('title'):
         task['title'] = new_title.strip()
-        add_task_history(task, f'Изменено название', current_user.id, users)
+        history.append(history_entry(task_id, f'Изменено название', current_user.id))
 
     if new_description is not None and new_description != task.get('description'):
         task['description'] = new_description.strip()
-        add_task_history(task, f'Изменено описание', current_user.id, users)
+        history.append(history_entry(task_id, f'Изменено описание', current_user.id))
 
     if new_start_date and new_start_date != task.get('start_date'):
         task['start_date'] = new_start_date
-        add_task_history(task, f'Изменена дата начала', current_user.id, users)
+        history.append(history_entry(task_id, f'Изменена дата начала', current_user.id))
 
     if new_deadline and new_deadline != task.get('deadline'):
         task['deadline'] = new_deadline
-        add_task_history(task, f'Изменен дедлайн', current_user.id, users)
+        history.append(history_entry(task_id, f'Изменен дедлайн', current_user.id))
 
     if 'status' in request.form and request.form['status'] != task.get('status'):
         new_status = request.form['status']
         task['status'] = new_status
-        add_task_history(task, f'Изменен статус на "{new_status}"', current_user.id, users)
+        history.append(history_entry(task_id, f'Изменен статус на "{new_status}"', current_user.id))
         if new_status == 'завершена':
             task['completion_date'] = datetime.now().strftime("%d/%m/%Y")
         else:
             task['completion_date'] = ""
 
-    for i, t in enumerate(tasks):
-        if t.get('id') == task_id:
-            tasks[i] = task
-            break
+    changes = {k: v for k, v in task.items() if original_task.get(k) != v}
 
-    save_data(app_config.TASKS_DB, tasks)
-
-    projects = load_data(app_config.PROJECTS_DB)
-    project = next((p for p in projects if p.get('id') == project_id), None)
-    if project:
-        project['last_activity'] = datetime.now().strftime("%d/%m/%Y")
-        for i, p in enumerate(projects):
-            if p.get('id') == project_id:
-                projects[i] = project
-                break
-        save_data(app_config.PROJECTS_DB, projects)
+    db.tasks.update(task_id, changes)
+    add_task_history(history)
+    db.projects.update(project_id, {'last_activity': datetime.now().strftime("%d/%m/%Y")})
 
     return jsonify({'success': True, 'message': 'Задача успешно обновлена'})
 
 
-@tasks_bp.route('/task/<task_id>/upload_file', methods=['POST'])
-@login_required
-def upload_task_file(task_id):
+def _check_upload_allowed(task_id):
     if not can_access_task(task_id):
         return jsonify({'error': 'У вас нет доступа к этой задаче'}), 403
 
-    tasks = load_data(app_config.TASKS_DB)
-    task = next((t for t in tasks if t.get('id') == task_id), None)
+    task = db.tasks.get_by_id(task_id)
 
     if not task:
         return jsonify({'error': 'Задача не найдена'}), 404
@@ -271,6 +492,29 @@ def upload_task_file(task_id):
     if current_user.role not in ['admin'] and current_user.id != task.get('assignee_id'):
         if not can_access_project(project_id) and current_user.role not in ['manager', 'supervisor']:
             return jsonify({'error': 'У вас нет прав для загрузки файлов к этой задаче'}), 403
+    return None
+
+
+def _get_upload_session(upload_id):
+    session = db.upload_sessions.get_by_id(upload_id)
+    if not session or session.get('user_id') != current_user.id:
+        return None
+    return session
+
+
+def _upload_error(error):
+    body = {'error': error.message}
+    if error.offset is not None:
+        body['offset'] = error.offset
+    return jsonify(body), error.status
+
+
+@tasks_bp.route('/task/<task_id>/upload_file', methods=['POST'])
+@login_required
+def upload_task_file(task_id):
+    denied = _check_upload_allowed(task_id)
+    if denied:
+        return denied
 
     if 'file' not in request.files:
         return jsonify({'error': 'Файл не был загружен'}), 400
@@ -280,41 +524,126 @@ def upload_task_file(task_id):
         return jsonify({'error': 'Файл не был выбран'}), 400
 
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        unique_filename = f"{task_id}_{uuid.uuid4().hex[:8]}_{filename}"
-        filepath = os.path.join(app_config.BASE_DIR, 'uploads', unique_filename)
-
-        file.save(filepath)
-
-        file_info = {
-            'filename': filename,
-            'unique_filename': unique_filename,
-            'uploaded_by': current_user.id,
-            'uploaded_at': datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
-            'size': os.path.getsize(filepath)
-        }
+        sha256, size = uploads.save_stream(file.stream)
+        file_info = uploads.make_file_info(task_id, file.filename, sha256, size, current_user.id)
+        try:
+            uploads.attach_file(task_id, file_info)
+        except uploads.UploadError as e:
+            return _upload_error(e)
 
-        tasks = load_data(app_config.TASKS_DB)
-        task = next((t for t in tasks if t.get('id') == task_id), None)
+        return jsonify({'success': True, 'message': 'Файл успешно загружен', 'file': file_info})
+    else:
+        return jsonify({'error': 'Недопустимый тип файла'}), 400
 
-        if not task:
-            os.remove(filepath)
-            return jsonify({'error': 'Задача не найдена'}), 404
 
-        if 'files' not in task:
-            task['files'] = []
-        task['files'].append(file_info)
+@tasks_bp.route('/task/<task_id>/uploads', methods=['POST'])
+@login_required
+def create_upload(task_id):
+    denied = _check_upload_allowed(task_id)
+    if denied:
+        return denied
+
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Некорректный формат запроса'}), 400
+    filename = data.get('filename', '')
+    if not isinstance(filename, str) or not filename or not allowed_file(filename):
+        return jsonify({'error': 'Недопустимый тип файла'}), 400
+    if data.get('sha256') is not None and not isinstance(data['sha256'], str):
+        return jsonify({'error': 'Некорректная контрольная сумма'}), 400
+    try:
+        size = -1 if isinstance(data.get('size'), bool) else int(data.get('size'))
+    except (TypeError, ValueError, OverflowError):
+        size = -1
+    if size <= 0:
+        return jsonify({'error': 'Некорректный размер файла'}), 400
+
+    if data.get('sha256') and uploads.claim_blob(data['sha256'], size):
+        # The content is already stored: attach it without a transfer.
+        file_info = uploads.make_file_info(task_id, filename, data['sha256'], size, current_user.id)
+        try:
+            uploads.attach_file(task_id, file_info)
+        except uploads.UploadError as e:
+            return _upload_error(e)
+        return jsonify({'success': True, 'message': 'Файл успешно загружен', 'file': file_info,
+                        'deduplicated': True})
 
-        for i, t in enumerate(tasks):
-            if t.get('id') == task_id:
-                tasks[i] = task
-                break
+    try:
+        session = uploads.create_session(task_id, current_user.id, filename, size)
+    except uploads.UploadError as e:
+        return _upload_error(e)
 
-        save_data(app_config.TASKS_DB, tasks)
+    return jsonify({'upload_id': session['id'], 'offset': 0, 'size': size,
+                    'url': url_for('tasks.upload_chunk', upload_id=session['id'])}), 201
 
-        return jsonify({'success': True, 'message': 'Файл успешно загружен', 'file': file_info})
-    else:
-        return jsonify({'error': 'Недопустимый тип файла'}), 400
+
+@tasks_bp.route('/uploads/<upload_id>', methods=['GET'])
+@login_required
+def upload_status(upload_id):
+    session = _get_upload_session(upload_id)
+    if not session:
+        return jsonify({'error': 'Сессия загрузки не найдена'}), 404
+    return jsonify({'upload_id': upload_id, 'offset': uploads.received_bytes(session), 'size': session['size']})
+
+
+@tasks_bp.route('/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def upload_chunk(upload_id):
+    session = _get_upload_session(upload_id)
+    if not session:
+        return jsonify({'error': 'Сессия загрузки не найдена'}), 404
+    try:
+        offset = uploads.write_chunk(session, request.headers.get('Content-Range'), request.stream)
+    except uploads.UploadError as e:
+        return _upload_error(e)
+    return jsonify({'upload_id': upload_id, 'offset': offset, 'size': session['size'],
+                    'complete': offset == session['size']})
+
+
+@tasks_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_upload(upload_id):
+    session = _get_upload_session(upload_id)
+    if not session:
+        return jsonify({'error': 'Сессия загрузки не найдена'}), 404
+    denied = _check_upload_allowed(session['task_id'])
+    if denied:
+        uploads.cancel_session(session)
+        return denied
+    try:
+        file_info = uploads.finalize_session(session, current_user.id)
+    except uploads.UploadError as e:
+        return _upload_error(e)
+    return jsonify({'success': True, 'message': 'Файл успешно загружен', 'file': file_info})
+
+
+@tasks_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def cancel_upload(upload_id):
+    session = _get_upload_session(upload_id)
+    if not session:
+        return jsonify({'error': 'Сессия загрузки не найдена'}), 404
+    uploads.cancel_session(session)
+    return jsonify({'success': True})
+
+
+@tasks_bp.route('/task/<task_id>/files/<unique_filename>')
+@login_required
+def download_task_file(task_id, unique_filename):
+    if not can_access_task(task_id):
+        return jsonify({'error': 'У вас нет доступа к этой задаче'}), 403
+
+    task = db.tasks.get_by_id(task_id)
+    if not task:
+        return jsonify({'error': 'Задача не найдена'}), 404
+
+    file_info = next((f for f in task.get('files', []) if f.get('unique_filename') == unique_filename), None)
+    response = uploads.send_attachment(file_info) if file_info else None
+    if response is None:
+        return jsonify({'error': 'Файл не найден'}), 404
+    return response
 
 
 @tasks_bp.route('/task/<task_id>')
@@ -324,73 +653,103 @@ def task_detail(task_id):
         flash('У вас нет доступа к этой задаче')
         return redirect(url_for('dashboard.dashboard'))
 
-    tasks = load_data(app_config.TASKS_DB)
-    users = load_data(app_config.USERS_DB)
-
-    task = next((t for t in tasks if t.get('id') == task_id), None)
+    task = db.tasks.get_by_id(task_id)
     if not task:
         flash('Задача не найдена')
         return redirect(url_for('dashboard.dashboard'))
 
-    assignee = next((u for u in users if u['id'] == task.get('assignee_id')), None) if task.get('assignee_id') else None
-    creator = next((u for u in users if u['id'] == task.get('created_by')), None) if task.get('created_by') else None
+    assignee = db.users.get_by_id(task.get('assignee_id')) if task.get('assignee_id') else None
+    creator = db.users.get_by_id(task.get('created_by')) if task.get('created_by') else None
 
     return render_template('task_detail.html', task=task, assignee=assignee, creator=creator)
 
 
+def _task_history_page(task, offset, limit):
+    history, total = get_history_log().read(task['id'], offset, limit)
+    if not total and offset == 0:
+        creator = db.users.get_by_id(task.get('created_by')) if task.get('created_by') else None
+        history = [
+            {
+                'action': 'Создание задачи',
+                'date': task.get('created_at', ''),
+                'user_id': task.get('created_by'),
+                'user_name': creator.get('name', creator.get('username', '')) if creator else 'Неизвестно'
+            }
+        ]
+    next_offset = offset + limit if offset + limit < total else None
+    return {'history': history, 'history_total': max(total, len(history)), 'history_next_offset': next_offset}
+
+
 @tasks_bp.route('/api/task/<task_id>')
 @login_required
 def api_task_detail(task_id):
     if not can_access_task(task_id):
         return jsonify({'error': 'У вас нет доступа к этой задаче'}), 403
 
-    tasks = load_data(app_config.TASKS_DB)
-    users = load_data(app_config.USERS_DB)
-
-    task = next((t for t in tasks if t.get('id') == task_id), None)
+    task = db.tasks.get_by_id(task_id)
     if not task:
         return jsonify({'error': 'Задача не найдена'}), 404
 
-    assignee = next((u for u in users if u['id'] == task.get('assignee_id')), None) if task.get('assignee_id') else None
-    if assignee:
-        from app.utils import get_user_token
-        token = get_user_token(task.get('assignee_id'), task.get('project_id'))
-        task['assignee_token'] = token
-        task['assignee_name'] = assignee.get('name', assignee.get('username', ''))
-    else:
-        task['assignee_token'] = None
-        task['assignee_name'] = 'Не назначен'
-
-    creator = next((u for u in users if u['id'] == task.get('created_by')), None) if task.get('created_by') else None
-    if creator:
-        task['creator_name'] = creator.get('name', creator.get('username', ''))
-    else:
-        task['creator_name'] = 'Неизвестно'
-
-    if 'history' not in task:
-        task['history'] = [
-            {
-                'action': 'Создание задачи',
-                'date': task.get('created_at', ''),
-                'user_id': task.get('created_by'),
-                'user_name': task.get('creator_name', 'Неизвестно')
-            }
-        ]
-
-    if 'files' not in task:
-        task['files'] = []
-
-    projects = load_data(app_config.PROJECTS_DB)
-    project = next((p for p in projects if p['id'] == task.get('project_id')), None)
-    team_users = []
+    project = db.projects.get_by_id(task.get('project_id'))
+    team_ids = []
     if project:
-        team_ids = project.get('team', [])
+        team_ids = list(project.get('team', []))
         if project.get('manager_id'):
             team_ids.append(project.get('manager_id'))
         if project.get('supervisor_id'):
             team_ids.append(project.get('supervisor_id'))
-        team_users = [{'id': u['id'], 'name': u['name']} for u in users if u['id'] in team_ids]
-    
-    task['team_users'] = team_users
+    users = {u['id']: u for u in db.users.get_many(team_ids + [task.get('assignee_id'), task.get('created_by')])}
+    assignee = users.get(task.get('assignee_id'))
+    assignee_token = get_user_token(assignee['id'], task.get('project_id')) if assignee else None
+
+    def task_etag():
+        return make_etag('task', task_id, task.get('rev'), (project or {}).get('rev'), get_history_log().count(task_id),
+                         sorted((u['id'], u.get('rev')) for u in users.values()), assignee_token)
+
+    def build():
+        result = dict(task)
+        if assignee:
+            result['assignee_token'] = assignee_token
+            result['assignee_name'] = assignee.get('name', assignee.get('username', ''))
+        else:
+            result['assignee_token'] = None
+            result['assignee_name'] = 'Не назначен'
+
+        creator = users.get(task.get('created_by'))
+        if creator:
+            result['creator_name'] = creator.get('name', creator.get('username', ''))
+        else:
+            result['creator_name'] = 'Неизвестно'
+
+        result.update(_task_history_page(task, 0, HISTORY_PAGE_SIZE))
+
+        if 'files' not in result:
+            result['files'] = []
+
+        result['team_users'] = [{'id': u['id'], 'name': u['name']} for u in users.values() if u['id'] in team_ids]
+
+        return result
+
+    return conditional_json(task_etag, build)
+
+
+@tasks_bp.route('/api/task/<task_id>/history')
+@login_required
+def api_task_history(task_id):
+    if not can_access_task(task_id):
+        return jsonify({'error': 'У вас нет доступа к этой задаче'}), 403
+
+    task = db.tasks.get_by_id(task_id)
+    if not task:
+        return jsonify({'error': 'Задача не найдена'}), 404
+
+    try:
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), 200)
+    except ValueError:
+        return jsonify({'error': 'Некорректные параметры страницы'}), 400
+
+    def history_etag():
+        return make_etag('task_history', task_id, offset, limit, get_history_log().count(task_id))
 
-    return jsonify(task)
+    return conditional_json(history_etag, lambda: _task_history_page(task, offset, limit))
@@ -0,0 +1,72 @@
+import bisect
+import heapq
+import math
+from operator import itemgetter
+from app.storage import db
+from app.text import PROJECT_SEARCH_FIELDS, TASK_SEARCH_FIELDS, MIN_TERM_LENGTH, query_terms
+
+SEARCH_KINDS = ['projects', 'tasks']
+SEARCH_FIELDS = {'projects': PROJECT_SEARCH_FIELDS, 'tasks': TASK_SEARCH_FIELDS}
+SEARCH_FIELD_WEIGHTS = {'name': 3.0, 'title': 3.0, 'expected_result': 1.0, 'description': 1.0}
+PREFIX_MATCH_WEIGHT = 0.5
+
+
+def _collection(kind):
+    return db.projects if kind == 'projects' else db.tasks
+
+
+def _term_scores(collection, fields, term):
+    # Best field weight per record; a term that only matches as the prefix
+    # of a longer word counts for less. Blocks are applied from the lowest
+    # score up, so each record ends up with the highest one.
+    blocks = []
+    for field in fields:
+        weight = SEARCH_FIELD_WEIGHTS[field]
+        items = collection.prefix_ids('search', (field, term[:MIN_TERM_LENGTH]), term)
+        # Exact matches sort before the longer terms sharing the prefix.
+        split = bisect.bisect_left(items, (term + '\0',))
+        blocks.append((weight, items[:split]))
+        blocks.append((weight * PREFIX_MATCH_WEIGHT, items[split:]))
+    scores = {}
+    for score, items in sorted(blocks, key=lambda block: block[0]):
+        scores.update(dict.fromkeys(map(itemgetter(1), items), score))
+    return scores
+
+
+def rank(kind, terms):
+    # Every term has to match. Each one adds its field weight scaled by how
+    # rare the term is across the collection; the rarest term goes first so
+    # the candidate set shrinks as early as possible.
+    collection = _collection(kind)
+    total = collection.count()
+    term_scores = sorted((_term_scores(collection, SEARCH_FIELDS[kind], term) for term in terms), key=len)
+    if not term_scores[0]:
+        return {}
+    ranked = None
+    for scores in term_scores:
+        idf = math.log(1 + total / len(scores))
+        if ranked is None:
+            ranked = {record_id: score * idf for record_id, score in scores.items()}
+        else:
+            ranked = {record_id: score + scores[record_id] * idf
+                      for record_id, score in ranked.items() if record_id in scores}
+        if not ranked:
+            break
+    return ranked
+
+
+def search(query, kinds, visible, limit):
+    # Returns the best (score, kind, record) matches and the number of
+    # matches in total. visible maps a kind to the ids the user may see,
+    # or to None when everything is visible.
+    terms = query_terms(query)
+    if not terms:
+        return [], 0
+    matches = []
+    for kind in kinds:
+        ranked = rank(kind, terms)
+        if visible.get(kind) is not None:
+            ranked = {record_id: ranked[record_id] for record_id in ranked.keys() & visible[kind]}
+        matches.extend((score, kind, record_id) for record_id, score in ranked.items())
+    best = heapq.nsmallest(limit, matches, key=lambda item: (-item[0], item[1], item[2]))
+    return [(score, kind, _collection(kind).get_by_id(record_id)) for score, kind, record_id in best], len(matches)
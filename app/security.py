@@ -0,0 +1,93 @@
+import time
+from functools import lru_cache
+from werkzeug.security import generate_password_hash
+from config import Config
+from app.storage import db
+
+app_config = Config()
+
+
+def hash_password(password):
+    return generate_password_hash(password, method=app_config.PASSWORD_HASH_METHOD,
+                                  salt_length=app_config.PASSWORD_SALT_LENGTH)
+
+
+@lru_cache(maxsize=None)
+def _policy_method():
+    # Werkzeug fills in its default cost parameters ('pbkdf2:sha256' becomes
+    # 'pbkdf2:sha256:<iterations>'), so compare against what it writes.
+    return hash_password('').split('$', 1)[0]
+
+
+def password_needs_rehash(password_hash):
+    parts = password_hash.split('$')
+    return len(parts) != 3 or parts[0] != _policy_method() or len(parts[1]) != app_config.PASSWORD_SALT_LENGTH
+
+
+def login_attempt_keys(username, remote_addr):
+    # The strict limit is per address and account, so guesses from elsewhere
+    # cannot lock the owner out. The per-address limit is looser so people
+    # sharing an office NAT do not lock each other out, and the account-wide
+    # ceiling only stops guessing spread over many addresses. Unknown
+    # usernames (None) are counted against the address alone.
+    keys = [('ip:%s' % remote_addr, app_config.LOGIN_MAX_ATTEMPTS_PER_IP)]
+    if username is not None:
+        username = username.lower()
+        keys += [('user:%s:%s' % (remote_addr, username), app_config.LOGIN_MAX_ATTEMPTS),
+                 ('account:%s' % username, app_config.LOGIN_MAX_ATTEMPTS_PER_ACCOUNT)]
+    return keys
+
+
+def _recent_failures(record, now):
+    return [t for t in record.get('failures', []) if t > now - app_config.LOGIN_ATTEMPT_WINDOW]
+
+
+def login_retry_after(keys):
+    # Seconds until another attempt is allowed, 0 when it is allowed now.
+    now = time.time()
+    wait = 0
+    for key, limit in keys:
+        record = db.login_attempts.get_by_id(key)
+        failures = _recent_failures(record, now) if record else []
+        if len(failures) >= limit:
+            wait = max(wait, failures[-limit] + app_config.LOGIN_ATTEMPT_WINDOW - now)
+    return int(wait) + 1 if wait else 0
+
+
+_last_attempt_purge = 0
+
+
+def purge_login_attempts():
+    # Drops counters whose last failure is older than the window.
+    cutoff = int(time.time() - app_config.LOGIN_ATTEMPT_WINDOW) - 1
+    with db.login_attempts.transaction() as tx:
+        stale = [r['id'] for _, r in db.login_attempts.range('last_failure', None, None, cutoff)]
+        for key in stale:
+            tx.delete(key)
+    if stale:
+        db.login_attempts.compact()
+    return len(stale)
+
+
+def maybe_purge_login_attempts():
+    global _last_attempt_purge
+    if time.time() - _last_attempt_purge >= app_config.LOGIN_ATTEMPT_PURGE_INTERVAL:
+        _last_attempt_purge = time.time()
+        purge_login_attempts()
+
+
+def record_login_failure(keys):
+    maybe_purge_login_attempts()
+    now = time.time()
+    with db.login_attempts.transaction() as tx:
+        for key, _ in keys:
+            record = tx.get_by_id(key)
+            failures = _recent_failures(record, now) if record else []
+            tx.insert({'id': key, 'failures': failures + [now]})
+
+
+def clear_login_failures(keys):
+    with db.login_attempts.transaction() as tx:
+        for key, _ in keys:
+            if not key.startswith('ip:'):
+                tx.delete(key)
@@ -0,0 +1,60 @@
+import json
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(value, pretty=False, sort_keys=False):
+    # UTF-8 bytes, non-ASCII left as is. orjson when installed, otherwise
+    # the standard library with the same output layout.
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(value, option=option)
+    if pretty:
+        return json.dumps(value, ensure_ascii=False, indent=2, sort_keys=sort_keys).encode('utf-8')
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), sort_keys=sort_keys).encode('utf-8')
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    # jsonify and request.get_json through orjson. Dates, dataclasses and
+    # the like still go through Flask's default() so responses look the
+    # same as with the stdlib provider.
+
+    def _options(self, pretty):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options(False)).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        data = orjson.dumps(obj, default=self.default, option=self._options(pretty))
+        return self._app.response_class(data + b'\n', mimetype=self.mimetype)
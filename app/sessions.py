@@ -0,0 +1,264 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from flask import session
+from flask.sessions import SessionInterface, SessionMixin, SecureCookieSessionInterface
+from itsdangerous import BadSignature
+from werkzeug.datastructures import CallbackDict
+from config import Config
+from app.storage import db, clone
+from app.models import load_user
+
+app_config = Config()
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, user_id=None, rev=None, refreshed_at=0):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.rev = rev
+        self.loaded_user_id = user_id
+        self.refreshed_at = refreshed_at
+        self.modified = False
+
+
+class MemorySessionStore:
+    # Sessions of a single worker process, least recently used first out.
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._records = OrderedDict()
+
+    def get(self, sid):
+        with self._lock:
+            record = self._records.get(sid)
+            if record is not None:
+                self._records.move_to_end(sid)
+            return record
+
+    def save(self, record):
+        with self._lock:
+            previous = self._records.get(record['id'])
+            record = dict(record, rev=previous['rev'] + 1 if previous else 1)
+            self._records[record['id']] = record
+            self._records.move_to_end(record['id'])
+            while len(self._records) > self.maxsize:
+                self._records.popitem(last=False)
+            return record
+
+    def delete(self, sid):
+        with self._lock:
+            self._records.pop(sid, None)
+
+    def delete_user(self, user_id):
+        with self._lock:
+            for sid in [sid for sid, r in self._records.items() if r.get('user_id') == user_id]:
+                del self._records[sid]
+
+    def touch_user(self, user_id):
+        with self._lock:
+            for sid, record in self._records.items():
+                if record.get('user_id') == user_id:
+                    self._records[sid] = dict(record, rev=record['rev'] + 1)
+
+
+class SharedSessionStore:
+    # Sessions in the sessions collection, so every worker sees the same
+    # ones; reads come from the collection's in-memory copy.
+
+    def get(self, sid):
+        return db.sessions.get_by_id(sid)
+
+    def save(self, record):
+        maybe_purge_sessions()
+        return db.sessions.insert(record)
+
+    def delete(self, sid):
+        db.sessions.delete(sid)
+
+    def delete_user(self, user_id):
+        with db.sessions.transaction() as tx:
+            for sid in db.sessions.lookup_ids('user_id', user_id):
+                tx.delete(sid)
+
+    def touch_user(self, user_id):
+        with db.sessions.transaction() as tx:
+            for sid in db.sessions.lookup_ids('user_id', user_id):
+                tx.modify(sid, lambda record: None)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+_last_session_purge = 0
+
+
+def get_session_store():
+    backend = app_config.SESSION_BACKEND
+    if backend == 'cookie':
+        return None
+    with _stores_lock:
+        store = _stores.get(backend)
+        if store is None:
+            if backend == 'memory':
+                store = MemorySessionStore(app_config.SESSION_CACHE_SIZE)
+            elif backend == 'shared':
+                store = SharedSessionStore()
+            else:
+                raise ValueError('Неизвестный тип хранилища сессий: %s' % backend)
+            _stores[backend] = store
+        return store
+
+
+def purge_sessions():
+    now = int(time.time())
+    with db.sessions.transaction() as tx:
+        expired = [s['id'] for _, s in db.sessions.range('expires_at', None, None, now - 1)]
+        for sid in expired:
+            tx.delete(sid)
+    if expired:
+        db.sessions.compact()
+    return len(expired)
+
+
+def maybe_purge_sessions():
+    global _last_session_purge
+    if time.time() - _last_session_purge >= app_config.SESSION_PURGE_INTERVAL:
+        _last_session_purge = time.time()
+        purge_sessions()
+
+
+class ServerSessionInterface(SessionInterface):
+    # Sessions of logged-in users live in the configured store and the
+    # cookie carries only a random session id, replaced whenever the user
+    # changes, so an id seen before login is useless afterwards. Anonymous
+    # sessions (flashes, the login redirect target) stay in a signed cookie
+    # as with Flask's default, so anonymous traffic writes nothing to the
+    # store. A signed cookie always contains a '.', a session id never does.
+
+    def __init__(self):
+        self._cookie_sessions = SecureCookieSessionInterface()
+
+    def _serializer(self, app):
+        return self._cookie_sessions.get_signing_serializer(app)
+
+    def open_session(self, app, request):
+        value = request.cookies.get(self.get_cookie_name(app))
+        if not value:
+            return ServerSession()
+        if '.' in value:
+            try:
+                data = self._serializer(app).loads(value, max_age=int(app.permanent_session_lifetime.total_seconds()))
+            except BadSignature:
+                return ServerSession()
+            return ServerSession(data)
+        record = get_session_store().get(value)
+        if record is None or record['expires_at'] < time.time():
+            return ServerSession()
+        return ServerSession(clone(record['data']), value, record.get('user_id'), record['rev'], record['refreshed_at'])
+
+    def _set_cookie(self, app, session, response, value):
+        response.set_cookie(self.get_cookie_name(app), value, expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app), domain=self.get_cookie_domain(app),
+                            path=self.get_cookie_path(app), secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app))
+        response.vary.add('Cookie')
+
+    def save_session(self, app, session, response):
+        store = get_session_store()
+        user_id = session.get('_user_id')
+
+        if not user_id:
+            if session.sid:
+                store.delete(session.sid)
+            if session:
+                if session.modified or session.sid:
+                    self._set_cookie(app, session, response, self._serializer(app).dumps(dict(session)))
+            elif session.modified or session.sid:
+                response.delete_cookie(self.get_cookie_name(app), domain=self.get_cookie_domain(app),
+                                       path=self.get_cookie_path(app))
+            return
+
+        now = time.time()
+        sid = session.sid
+        if sid is None or user_id != session.loaded_user_id:
+            if sid:
+                store.delete(sid)
+            sid = secrets.token_urlsafe(32)
+        elif not session.modified and now - session.refreshed_at < app_config.SESSION_REFRESH_INTERVAL:
+            return
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        store.save({'id': sid, 'user_id': user_id, 'data': dict(session),
+                    'refreshed_at': int(now), 'expires_at': int(now + lifetime)})
+        self._set_cookie(app, session, response, sid)
+
+
+# Resolved User and access context per session, so a request only has to
+# check that the session record has not changed since they were cached.
+_auth_cache = OrderedDict()
+_auth_cache_lock = threading.Lock()
+
+
+def _cached_auth():
+    sid = getattr(session, 'sid', None)
+    if sid is None:
+        return None
+    with _auth_cache_lock:
+        entry = _auth_cache.get(sid)
+        if entry is None or entry['rev'] != session.rev:
+            return None
+        _auth_cache.move_to_end(sid)
+        return entry
+
+
+def _cache_auth(**values):
+    sid = getattr(session, 'sid', None)
+    if sid is None:
+        return
+    with _auth_cache_lock:
+        entry = _auth_cache.get(sid)
+        if entry is None or entry['rev'] != session.rev:
+            entry = _auth_cache[sid] = {'rev': session.rev, 'user': None, 'access': None}
+        entry.update(values)
+        _auth_cache.move_to_end(sid)
+        while len(_auth_cache) > app_config.SESSION_CACHE_SIZE:
+            _auth_cache.popitem(last=False)
+
+
+def load_session_user(user_id):
+    entry = _cached_auth()
+    if entry and entry['user'] is not None and entry['user'].id == user_id:
+        return entry['user']
+    user = load_user(user_id)
+    if user is not None:
+        _cache_auth(user=user, access=None)
+    return user
+
+
+def cached_access_context(version):
+    entry = _cached_auth()
+    if entry and entry['access'] is not None and entry['access'].version == version:
+        return entry['access']
+    return None
+
+
+def cache_access_context(context):
+    _cache_auth(access=context)
+
+
+def revoke_user_sessions(user_id):
+    # Signed-cookie sessions cannot be revoked; they rely on load_user.
+    store = get_session_store()
+    if store is not None:
+        store.delete_user(user_id)
+
+
+def refresh_user_sessions(user_id):
+    # Keeps the sessions but makes every worker resolve the user again.
+    store = get_session_store()
+    if store is not None:
+        store.touch_user(user_id)
@@ -5,6 +5,7 @@ document.addEventListener('DOMContentLoaded', function() {
     initTaskFilters();
     initGanttChart();
     initTaskModal();
+    initSearch();
 });
 
 function initMobileMenu() {
@@ -20,6 +21,53 @@ function initMobileMenu() {
     }
 }
 
+function initSearch() {
+    const input = document.getElementById('global-search');
+    const results = document.getElementById('search-results');
+    if (!input || !results) return;
+
+    let timer = null;
+    let lastQuery = '';
+
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        timer = setTimeout(function() {
+            const query = input.value.trim();
+            if (query === lastQuery) return;
+            lastQuery = query;
+            if (query.length < 2) {
+                results.innerHTML = '';
+                results.classList.remove('active');
+                return;
+            }
+            fetch(`/api/search?q=${encodeURIComponent(query)}&limit=10`)
+                .then(response => response.json())
+                .then(data => {
+                    if (query !== lastQuery) return;
+                    if (!data.results || data.results.length === 0) {
+                        results.innerHTML = '<div class="search-empty">Ничего не найдено</div>';
+                    } else {
+                        results.innerHTML = data.results.map(item => `
+                            <a class="search-item" href="${escapeHtml(item.url)}">
+                                <span class="search-type">${item.type === 'project' ? 'Проект' : 'Задача'}</span>
+                                <span class="search-title">${escapeHtml(item.title)}</span>
+                                ${item.project_name ? `<span class="search-meta">${escapeHtml(item.project_name)}</span>` : ''}
+                            </a>
+                        `).join('');
+                    }
+                    results.classList.add('active');
+                })
+                .catch(error => console.error('Error searching:', error));
+        }, 200);
+    });
+
+    document.addEventListener('click', function(event) {
+        if (!results.contains(event.target) && event.target !== input) {
+            results.classList.remove('active');
+        }
+    });
+}
+
 function initTabs() {
     const tabButtons = document.querySelectorAll('.tab-btn');
     const tabContents = document.querySelectorAll('.tab-content');
@@ -68,39 +116,88 @@ function initProjectFilters() {
     }
 }
 
+function escapeHtml(value) {
+    return String(value === null || value === undefined ? '' : value)
+        .replace(/&/g, '&amp;')
+        .replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;')
+        .replace(/"/g, '&quot;')
+        .replace(/'/g, '&#39;');
+}
+
+function taskStatusClass(status) {
+    if (status === 'активна') return 'active';
+    if (status === 'завершена') return 'completed';
+    return 'paused';
+}
+
+function renderTaskCard(task) {
+    const statusClass = taskStatusClass(task.status);
+    return `
+        <div class="task-card status-${statusClass}" data-project-id="${escapeHtml(task.project_id)}" data-status="${escapeHtml(task.status)}">
+            <h4>${escapeHtml(task.title)}</h4>
+            <p><strong>Проект:</strong> ${escapeHtml(task.project_name || 'Неизвестно')}</p>
+            <p><strong>Статус:</strong> <span class="status-badge status-${statusClass}">${escapeHtml(task.status)}</span></p>
+            <p><strong>Дедлайн:</strong> ${escapeHtml(task.deadline)}</p>
+            <a href="/task/${encodeURIComponent(task.id)}" class="btn">Подробнее</a>
+        </div>
+    `;
+}
+
 function initTaskFilters() {
     const projectFilter = document.getElementById('task-project-filter');
     const statusFilter = document.getElementById('task-status-filter');
     const tasksList = document.getElementById('tasks-list');
+    const loadMoreButton = document.getElementById('tasks-load-more');
     
-    if (tasksList) {
-        function filterTasks() {
-            const projectId = projectFilter ? projectFilter.value : '';
-            const status = statusFilter ? statusFilter.value : '';
-            const taskCards = tasksList.querySelectorAll('.task-card');
-            
-            taskCards.forEach(card => {
-                const cardProjectId = card.dataset.projectId;
-                const cardStatus = card.dataset.status;
+    if (!tasksList) return;
+    
+    let nextCursor = null;
+    let requestId = 0;
+    
+    function loadTasks(reset) {
+        const params = new URLSearchParams();
+        if (projectFilter && projectFilter.value) params.set('project_id', projectFilter.value);
+        if (statusFilter && statusFilter.value) params.set('status', statusFilter.value);
+        params.set('limit', tasksList.dataset.pageSize || 20);
+        if (!reset && nextCursor) params.set('cursor', nextCursor);
+        
+        const currentRequest = ++requestId;
+        fetch(`/api/tasks?${params.toString()}`)
+            .then(response => response.json())
+            .then(data => {
+                if (currentRequest !== requestId) return;
+                if (reset) tasksList.innerHTML = '';
                 
-                let showByProject = !projectId || cardProjectId === projectId;
-                let showByStatus = !status || cardStatus === status;
+                tasksList.insertAdjacentHTML('beforeend', (data.tasks || []).map(renderTaskCard).join(''));
+                nextCursor = data.next_cursor;
                 
-                card.style.display = (showByProject && showByStatus) ? '' : 'none';
+                if (loadMoreButton) {
+                    loadMoreButton.style.display = nextCursor ? '' : 'none';
+                }
+                if (!tasksList.children.length) {
+                    tasksList.innerHTML = '<p class="no-data">Нет назначенных задач</p>';
+                }
+            })
+            .catch(error => {
+                console.error('Error loading tasks:', error);
             });
-        }
-        
-        if (projectFilter) {
-            projectFilter.addEventListener('change', filterTasks);
-        }
-        if (statusFilter) {
-            statusFilter.addEventListener('change', filterTasks);
-        }
     }
+    
+    if (projectFilter) {
+        projectFilter.addEventListener('change', () => loadTasks(true));
+    }
+    if (statusFilter) {
+        statusFilter.addEventListener('change', () => loadTasks(true));
+    }
+    if (loadMoreButton) {
+        loadMoreButton.addEventListener('click', () => loadTasks(false));
+    }
+    
+    loadTasks(true);
 }
 
 let currentZoom = 'week';
-let ganttTasks = [];
 
 function initGanttChart() {
     const ganttContainer = document.getElementById('gantt-chart');
@@ -115,19 +212,16 @@ function initGanttChart() {
             currentZoom = this.dataset.zoom;
             
             if (ganttContainer.dataset.projectId) {
-                renderGantt();
+                loadGanttData(ganttContainer.dataset.projectId);
             }
         });
     });
 }
 
 function loadGanttData(projectId) {
-    fetch(`/api/project/${projectId}/tasks`)
+    fetch(`/api/project/${projectId}/gantt?zoom=${currentZoom}`)
         .then(response => response.json())
-        .then(tasks => {
-            ganttTasks = tasks;
-            renderGantt();
-        })
+        .then(renderGantt)
         .catch(error => {
             console.error('Error loading tasks:', error);
         });
@@ -157,6 +251,20 @@ function parseDate(dateStr) {
     return new Date(dateStr);
 }
 
+const ORDINAL_UNIX_EPOCH = 719163;
+
+function ordinalToDate(ordinal) {
+    return new Date(1970, 0, 1 + ordinal - ORDINAL_UNIX_EPOCH);
+}
+
+function taskDate(task, field) {
+    const ordinal = task[field + '_ord'];
+    if (ordinal !== undefined) {
+        return ordinal === null ? null : ordinalToDate(ordinal);
+    }
+    return parseDate(task[field]);
+}
+
 function formatDateDDMMYYYY(date) {
     const day = String(date.getDate()).padStart(2, '0');
     const month = String(date.getMonth() + 1).padStart(2, '0');
@@ -164,145 +272,52 @@ function formatDateDDMMYYYY(date) {
     return `${day}/${month}/${year}`;
 }
 
-function renderGantt() {
+const GANTT_CELL_WIDTHS = { day: 40, week: 50, month: 60, year: 80 };
+
+function renderGantt(gantt) {
     const ganttChart = document.getElementById('gantt-chart');
-    if (!ganttChart || ganttTasks.length === 0) {
+    if (!ganttChart) return;
+    
+    if (!gantt.task_count) {
         ganttChart.innerHTML = '<p class="no-data">Нет задач для отображения</p>';
         return;
     }
-    
-    let minDate = null;
-    let maxDate = null;
-    
-    ganttTasks.forEach(task => {
-        const startDate = parseDate(task.start_date) || parseDate(task.created_at);
-        const endDate = parseDate(task.deadline);
-        
-        if (startDate && (!minDate || startDate < minDate)) {
-            minDate = new Date(startDate);
-        }
-        if (endDate && (!maxDate || endDate > maxDate)) {
-            maxDate = new Date(endDate);
-        }
-    });
-    
-    if (!minDate || !maxDate) {
+    if (!gantt.unit) {
         ganttChart.innerHTML = '<p class="no-data">Недостаточно данных для диаграммы</p>';
         return;
     }
     
-    minDate.setDate(minDate.getDate() - 3);
-    maxDate.setDate(maxDate.getDate() + 7);
-    
-    let cellWidth, dateFormat;
-    switch (currentZoom) {
-        case 'day':
-            cellWidth = 40;
-            dateFormat = 'day';
-            break;
-        case 'week':
-            cellWidth = 35;
-            dateFormat = 'day';
-            break;
-        case 'month':
-            cellWidth = 20;
-            dateFormat = 'day';
-            break;
-        case 'year':
-            cellWidth = 60;
-            dateFormat = 'month';
-            break;
-        default:
-            cellWidth = 35;
-            dateFormat = 'day';
-    }
-    
-    let timelineItems = [];
-    const today = new Date();
-    today.setHours(0, 0, 0, 0);
-    
-    if (currentZoom === 'year') {
-        const startMonth = new Date(minDate.getFullYear(), minDate.getMonth(), 1);
-        const endMonth = new Date(maxDate.getFullYear(), maxDate.getMonth() + 1, 0);
-        
-        let currentMonth = new Date(startMonth);
-        while (currentMonth <= endMonth) {
-            const isCurrentMonth = currentMonth.getMonth() === today.getMonth() && 
-                                  currentMonth.getFullYear() === today.getFullYear();
-            timelineItems.push({
-                date: new Date(currentMonth),
-                label: currentMonth.toLocaleDateString('ru-RU', { month: 'short' }),
-                isToday: isCurrentMonth,
-                isWeekend: false
-            });
-            currentMonth.setMonth(currentMonth.getMonth() + 1);
-        }
-    } else {
-        let currentDate = new Date(minDate);
-        while (currentDate <= maxDate) {
-            const dayOfWeek = currentDate.getDay();
-            const isWeekend = dayOfWeek === 0 || dayOfWeek === 6;
-            const isToday = currentDate.getTime() === today.getTime();
-            
-            timelineItems.push({
-                date: new Date(currentDate),
-                label: currentDate.getDate(),
-                isToday: isToday,
-                isWeekend: isWeekend
-            });
-            currentDate.setDate(currentDate.getDate() + 1);
-        }
-    }
+    const cellWidth = GANTT_CELL_WIDTHS[gantt.zoom] || 35;
     
     let html = '<div class="gantt-timeline">';
     html += `<div class="gantt-task-label" style="min-width: 160px; border-right: 2px solid var(--gray-300);">Задача</div>`;
     
-    timelineItems.forEach(item => {
+    gantt.columns.forEach(column => {
         let classes = 'gantt-timeline-item';
-        if (item.isToday) classes += ' today';
-        if (item.isWeekend) classes += ' weekend';
-        html += `<div class="${classes}" style="min-width: ${cellWidth}px;">${item.label}</div>`;
+        if (column.today) classes += ' today';
+        if (column.weekend) classes += ' weekend';
+        html += `<div class="${classes}" style="min-width: ${cellWidth}px;">${column.label}</div>`;
     });
     html += '</div>';
     
     html += '<div class="gantt-tasks">';
     
-    ganttTasks.forEach(task => {
-        const startDate = parseDate(task.start_date) || parseDate(task.created_at);
-        const endDate = parseDate(task.deadline);
-        
-        if (!startDate || !endDate) return;
-        
+    gantt.tasks.forEach(task => {
         let statusClass = 'status-active';
         if (task.status === 'завершена') statusClass = 'status-completed';
         else if (task.status === 'отложена') statusClass = 'status-paused';
         
-        let startOffset, barWidth;
-        
-        if (currentZoom === 'year') {
-            const startMonthDiff = (startDate.getFullYear() - minDate.getFullYear()) * 12 + 
-                                  (startDate.getMonth() - minDate.getMonth());
-            const endMonthDiff = (endDate.getFullYear() - minDate.getFullYear()) * 12 + 
-                                (endDate.getMonth() - minDate.getMonth());
-            startOffset = startMonthDiff * cellWidth;
-            barWidth = Math.max((endMonthDiff - startMonthDiff + 1) * cellWidth, cellWidth);
-        } else {
-            const startDaysDiff = Math.floor((startDate - minDate) / (1000 * 60 * 60 * 24));
-            const endDaysDiff = Math.floor((endDate - minDate) / (1000 * 60 * 60 * 24));
-            startOffset = startDaysDiff * cellWidth;
-            barWidth = Math.max((endDaysDiff - startDaysDiff + 1) * cellWidth, cellWidth);
-        }
-        
-        const assigneeName = task.assignee_name || 'Не назначен';
+        const title = escapeHtml(task.title);
+        const assigneeName = escapeHtml(task.assignee_name);
         
         html += `
             <div class="gantt-row">
-                <div class="gantt-task-label" title="${task.title}">${task.title}</div>
+                <div class="gantt-task-label" title="${title}">${title}</div>
                 <div class="gantt-task-bar-container">
                     <div class="gantt-task-bar ${statusClass}" 
-                         style="left: ${startOffset}px; width: ${barWidth}px;"
-                         data-task-id="${task.id}"
-                         title="${task.title} - ${assigneeName}">
+                         style="left: ${task.offset * cellWidth}px; width: ${task.span * cellWidth}px;"
+                         data-task-id="${escapeHtml(task.id)}"
+                         title="${title} - ${assigneeName}">
                         ${assigneeName}
                     </div>
                 </div>
@@ -375,8 +390,8 @@ function openTaskModal(taskId) {
             document.getElementById('edit-task-description').value = task.description || '';
             document.getElementById('edit-task-status').value = task.status || 'активна';
             
-            const startDate = parseDate(task.start_date);
-            const deadline = parseDate(task.deadline);
+            const startDate = taskDate(task, 'start_date');
+            const deadline = taskDate(task, 'deadline');
             
             if (startDate) {
                 document.getElementById('edit-task-start').value = formatDateForInput(startDate);
@@ -403,14 +418,7 @@ function openTaskModal(taskId) {
             const historyList = modal.querySelector('.history-list');
             if (historyList && task.history) {
                 historyList.innerHTML = '';
-                task.history.forEach(entry => {
-                    historyList.innerHTML += `
-                        <div class="history-item">
-                            <strong>${entry.action}</strong>
-                            <span class="history-date">${entry.date} - ${entry.user_name}</span>
-                        </div>
-                    `;
-                });
+                renderHistoryPage(historyList, task.id, task.history, task.history_next_offset);
             }
             
             modal.classList.add('active');
@@ -421,6 +429,34 @@ function openTaskModal(taskId) {
         });
 }
 
+function renderHistoryPage(historyList, taskId, entries, nextOffset) {
+    const previousButton = historyList.querySelector('.history-more');
+    if (previousButton) previousButton.remove();
+
+    entries.forEach(entry => {
+        historyList.insertAdjacentHTML('beforeend', `
+            <div class="history-item">
+                <strong>${escapeHtml(entry.action)}</strong>
+                <span class="history-date">${escapeHtml(entry.date)} - ${escapeHtml(entry.user_name)}</span>
+            </div>
+        `);
+    });
+
+    if (nextOffset !== null && nextOffset !== undefined) {
+        const button = document.createElement('button');
+        button.type = 'button';
+        button.className = 'btn small-btn history-more';
+        button.textContent = 'Показать ещё';
+        button.addEventListener('click', function() {
+            fetch(`/api/task/${taskId}/history?offset=${nextOffset}`)
+                .then(response => response.json())
+                .then(page => renderHistoryPage(historyList, taskId, page.history, page.history_next_offset))
+                .catch(error => console.error('Error loading history:', error));
+        });
+        historyList.appendChild(button);
+    }
+}
+
 function closeTaskModal() {
     const modal = document.getElementById('task-modal');
     if (modal) {
@@ -0,0 +1,45 @@
+from flask_login import current_user
+from app.storage import db
+
+TASK_STATUSES = ['активна', 'завершена', 'отложена']
+
+
+def project_task_counts(project_id):
+    counts = {status: db.tasks.count('project_status', (project_id, status)) for status in TASK_STATUSES}
+    counts['total'] = db.tasks.count('project_id', project_id)
+    return counts
+
+
+def user_task_counts(user_id):
+    counts = {status: db.tasks.count('assignee_status', (user_id, status)) for status in TASK_STATUSES}
+    counts['total'] = db.tasks.count('assignee_id', user_id)
+    return counts
+
+
+def total_task_counts():
+    counts = {status: db.tasks.count('status', status) for status in TASK_STATUSES}
+    counts['total'] = db.tasks.count()
+    return counts
+
+
+def get_dashboard_stats(visible_projects):
+    if current_user.role == 'admin':
+        task_counts = total_task_counts()
+        active_projects = db.projects.count('status', 'в работе')
+    else:
+        if current_user.role in ['manager', 'supervisor']:
+            task_counts = {'total': 0}
+            for project in visible_projects:
+                for status, count in project_task_counts(project['id']).items():
+                    task_counts[status] = task_counts.get(status, 0) + count
+        else:
+            task_counts = user_task_counts(current_user.id)
+        active_projects = len([p for p in visible_projects if p['status'] == 'в работе'])
+
+    return {
+        'total_projects': len(visible_projects),
+        'active_projects': active_projects,
+        'total_tasks': task_counts['total'],
+        'active_tasks': task_counts.get('активна', 0),
+        'completed_tasks': task_counts.get('завершена', 0)
+    }
@@ -0,0 +1,555 @@
+import bisect
+import os
+import threading
+from contextlib import contextmanager
+from config import Config
+from app.backends import JsonBackend, SqliteBackend
+from app.dates import TASK_DATE_FIELDS, PROJECT_DATE_FIELDS, NO_DATE, add_date_ordinals, needs_date_ordinals
+from app.text import PROJECT_SEARCH_FIELDS, TASK_SEARCH_FIELDS, search_entries
+
+app_config = Config()
+
+
+def clone(value):
+    if isinstance(value, dict):
+        return {k: clone(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [clone(v) for v in value]
+    return value
+
+
+class Collection:
+    # Records handed out by the read methods are shared with the cache and
+    # must be treated as read-only: copy them before changing anything and
+    # persist through insert/update/modify/delete.
+
+    def __init__(self, backend, indexes=None, normalize=None, sorted_indexes=None):
+        self.backend = backend
+        self.normalize = normalize
+        self._lock = threading.RLock()
+        self._records = {}
+        self._positions = {}
+        self._next_position = 0
+        self._index_keys = dict(indexes or {})
+        self._indexes = {name: {} for name in self._index_keys}
+        # Sorted indexes map a group key to a sorted list of (value, id), so
+        # range queries are a bisect plus a slice.
+        self._sorted_keys = dict(sorted_indexes or {})
+        self._sorted = {name: {} for name in self._sorted_keys}
+
+    def _refresh(self):
+        if not self.backend.stale():
+            return
+        with self.backend.lock(exclusive=False):
+            records, ops = self.backend.read_changes()
+            if records is not None:
+                self._load(records)
+            for op in ops:
+                self._apply(op)
+
+    def _apply(self, op):
+        if op['op'] == 'put':
+            self._put(op['record'])
+        elif op['op'] == 'delete' and op['id'] in self._records:
+            self._remove(op['id'])
+
+    def _load(self, records):
+        # Builds the indexes in bulk: sorting each list once is much cheaper
+        # than inserting every entry into its place.
+        self._records = {}
+        self._positions = {}
+        self._next_position = 0
+        for record in records:
+            record_id = record.get('id')
+            if record_id not in self._positions:
+                self._positions[record_id] = self._next_position
+                self._next_position += 1
+            self._records[record_id] = record
+        self._indexes = {name: {} for name in self._index_keys}
+        for name, index in self._indexes.items():
+            for record_id, record in self._records.items():
+                for key in self._keys(name, record):
+                    index.setdefault(key, set()).add(record_id)
+        self._sorted = {name: {} for name in self._sorted_keys}
+        for name, groups in self._sorted.items():
+            for record_id, record in self._records.items():
+                for group, value in self._sorted_entries(name, record):
+                    groups.setdefault(group, []).append((value, record_id))
+            for items in groups.values():
+                items.sort()
+
+    def _keys(self, name, record):
+        if record is None:
+            return set()
+        return {k for k in self._index_keys[name](record) if k is not None}
+
+    def _sorted_entries(self, name, record):
+        if record is None:
+            return set()
+        return {(group, value) for group, value in self._sorted_keys[name](record) if value is not None}
+
+    def _unsort(self, name, record_id, entries):
+        for group, value in entries:
+            items = self._sorted[name][group]
+            i = bisect.bisect_left(items, (value, record_id))
+            if i < len(items) and items[i] == (value, record_id):
+                del items[i]
+            if not items:
+                del self._sorted[name][group]
+
+    def _put(self, record):
+        record_id = record.get('id')
+        old = self._records.get(record_id)
+        if old is None:
+            self._positions[record_id] = self._next_position
+            self._next_position += 1
+        self._records[record_id] = record
+        for name, index in self._indexes.items():
+            old_keys = self._keys(name, old)
+            new_keys = self._keys(name, record)
+            for key in old_keys - new_keys:
+                bucket = index[key]
+                bucket.discard(record_id)
+                if not bucket:
+                    del index[key]
+            for key in new_keys - old_keys:
+                index.setdefault(key, set()).add(record_id)
+        for name, groups in self._sorted.items():
+            old_entries = self._sorted_entries(name, old)
+            new_entries = self._sorted_entries(name, record)
+            self._unsort(name, record_id, old_entries - new_entries)
+            for group, value in new_entries - old_entries:
+                bisect.insort(groups.setdefault(group, []), (value, record_id))
+
+    def _remove(self, record_id):
+        old = self._records.pop(record_id)
+        self._positions.pop(record_id, None)
+        for name, index in self._indexes.items():
+            for key in self._keys(name, old):
+                bucket = index[key]
+                bucket.discard(record_id)
+                if not bucket:
+                    del index[key]
+        for name in self._sorted:
+            self._unsort(name, record_id, self._sorted_entries(name, old))
+
+    @contextmanager
+    def _writing(self):
+        with self._lock, self.backend.lock(exclusive=True):
+            self._refresh()
+            ops = []
+            yield ops
+            if ops:
+                self.backend.append(ops)
+                for op in ops:
+                    self._apply(op)
+                if self.backend.should_compact():
+                    self.backend.compact(self._records.values())
+
+    @property
+    def version(self):
+        # Identifies the stored state of the collection; every worker
+        # reading the same data reports the same value.
+        with self._lock:
+            self._refresh()
+            return self.backend.revision()
+
+    def all(self):
+        with self._lock:
+            self._refresh()
+            return list(self._records.values())
+
+    def ids(self):
+        with self._lock:
+            self._refresh()
+            return set(self._records)
+
+    def get_by_id(self, record_id):
+        with self._lock:
+            self._refresh()
+            return self._records.get(record_id)
+
+    def filter(self, predicate=None, **fields):
+        with self._lock:
+            self._refresh()
+            records = list(self._records.values())
+        return [r for r in records
+                if all(r.get(k) == v for k, v in fields.items())
+                and (predicate is None or predicate(r))]
+
+    def first(self, predicate=None, **fields):
+        found = self.filter(predicate, **fields)
+        return found[0] if found else None
+
+    def get_many(self, record_ids):
+        with self._lock:
+            self._refresh()
+            ids = [i for i in set(record_ids) if i in self._records]
+            ids.sort(key=self._positions.__getitem__)
+            return [self._records[i] for i in ids]
+
+    def lookup_ids(self, index, key):
+        with self._lock:
+            self._refresh()
+            return set(self._indexes[index].get(key, ()))
+
+    def lookup(self, index, key):
+        return self.get_many(self.lookup_ids(index, key))
+
+    def _range_items(self, index, group, low, high, limit):
+        items = self._sorted[index].get(group, [])
+        start = 0 if low is None else bisect.bisect_left(items, (low,))
+        end = len(items) if high is None else bisect.bisect_left(items, (high + 1,))
+        if limit is not None:
+            end = min(end, start + limit)
+        return items[start:end]
+
+    def range(self, index, group, low=None, high=None, limit=None):
+        # Records of one group whose sorted value lies within [low, high],
+        # in ascending order of that value.
+        with self._lock:
+            self._refresh()
+            return [(value, self._records[record_id])
+                    for value, record_id in self._range_items(index, group, low, high, limit)]
+
+    def range_ids(self, index, group, low=None, high=None, limit=None):
+        with self._lock:
+            self._refresh()
+            return self._range_items(index, group, low, high, limit)
+
+    def walk(self, index, group, start=None, reverse=False, batch_size=256):
+        # (value, id) pairs of one group in sorted order, beginning after
+        # the pair start (or before it when reverse). Pairs are read in
+        # batches, each resuming from the last pair handed out, so a caller
+        # that stops early only pays for what it consumed.
+        while True:
+            with self._lock:
+                self._refresh()
+                items = self._sorted[index].get(group, [])
+                if reverse:
+                    end = len(items) if start is None else bisect.bisect_left(items, start)
+                    batch = items[max(end - batch_size, 0):end][::-1]
+                else:
+                    begin = 0 if start is None else bisect.bisect_right(items, start)
+                    batch = items[begin:begin + batch_size]
+            if not batch:
+                return
+            yield from batch
+            start = batch[-1]
+
+    def prefix_ids(self, index, group, prefix):
+        # (value, id) pairs of one group whose string value starts with
+        # prefix, in ascending order of that value.
+        with self._lock:
+            self._refresh()
+            items = self._sorted[index].get(group, [])
+            start = bisect.bisect_left(items, (prefix,))
+            end = bisect.bisect_left(items, (prefix + '\uffff',), start)
+            return items[start:end]
+
+    def count(self, index=None, key=None):
+        with self._lock:
+            self._refresh()
+            if index is None:
+                return len(self._records)
+            return len(self._indexes[index].get(key, ()))
+
+    @contextmanager
+    def transaction(self):
+        with self._writing() as ops:
+            yield Transaction(self, ops)
+
+    def insert(self, record):
+        with self.transaction() as tx:
+            return tx.insert(record)
+
+    def insert_many(self, records):
+        with self.transaction() as tx:
+            return [tx.insert(record) for record in records]
+
+    def update(self, record_id, changes):
+        with self.transaction() as tx:
+            return tx.update(record_id, changes)
+
+    def modify(self, record_id, mutator):
+        with self.transaction() as tx:
+            return tx.modify(record_id, mutator)
+
+    def delete(self, record_id):
+        with self.transaction() as tx:
+            return tx.delete(record_id)
+
+    def exists(self):
+        return self.backend.exists()
+
+    def replace_all(self, records):
+        records = clone(list(records))
+        if self.normalize:
+            for record in records:
+                self.normalize(record)
+        with self._lock, self.backend.lock(exclusive=True):
+            self._load(records)
+            self.backend.replace(self._records.values())
+
+    def compact(self):
+        with self._lock, self.backend.lock(exclusive=True):
+            self._refresh()
+            self.backend.compact(self._records.values())
+
+    def drop(self):
+        with self._lock, self.backend.lock(exclusive=True):
+            self.backend.drop()
+            self._load([])
+
+
+class Transaction:
+    # Collects operations and commits them with a single backend write when
+    # the surrounding Collection.transaction() block exits.
+
+    def __init__(self, collection, ops):
+        self.collection = collection
+        self._ops = ops
+        self._pending = {}
+
+    def get_by_id(self, record_id):
+        if record_id in self._pending:
+            return self._pending[record_id]
+        return self.collection._records.get(record_id)
+
+    def insert(self, record):
+        record = clone(record)
+        if self.collection.normalize:
+            self.collection.normalize(record)
+        existing = self.get_by_id(record.get('id'))
+        record['rev'] = existing.get('rev', 0) + 1 if existing else 1
+        self._pending[record.get('id')] = record
+        self._ops.append({'op': 'put', 'record': record})
+        return record
+
+    def update(self, record_id, changes):
+        changes = clone(changes)
+        return self.modify(record_id, lambda record: record.update(changes))
+
+    def modify(self, record_id, mutator):
+        current = self.get_by_id(record_id)
+        if current is None:
+            return None
+        record = dict(current)
+        mutator(record)
+        if self.collection.normalize:
+            self.collection.normalize(record)
+        record['rev'] = current.get('rev', 0) + 1
+        self._pending[record_id] = record
+        self._ops.append({'op': 'put', 'record': record})
+        return record
+
+    def delete(self, record_id):
+        if self.get_by_id(record_id) is None:
+            return False
+        self._pending[record_id] = None
+        self._ops.append({'op': 'delete', 'id': record_id})
+        return True
+
+
+USER_INDEXES = {
+    'username': lambda u: (u.get('username'),),
+}
+
+PROJECT_INDEXES = {
+    'status': lambda p: (p.get('status'),),
+    'manager_id': lambda p: (p.get('manager_id'),),
+    'supervisor_id': lambda p: (p.get('supervisor_id'),),
+    'team': lambda p: p.get('team') or (),
+}
+
+PROJECT_SORTED_INDEXES = {
+    'search': lambda p: search_entries(p, PROJECT_SEARCH_FIELDS),
+}
+
+TASK_INDEXES = {
+    'project_id': lambda t: (t.get('project_id'),),
+    'assignee_id': lambda t: (t.get('assignee_id'),),
+    'status': lambda t: (t.get('status'),),
+    'project_status': lambda t: ((t.get('project_id'), t.get('status')),),
+    'assignee_status': lambda t: ((t.get('assignee_id'), t.get('status')),),
+    'sha256': lambda t: [f.get('sha256') for f in t.get('files') or ()],
+}
+
+def _open_deadlines(task):
+    if task.get('status') == 'завершена':
+        return ()
+    deadline = task.get('deadline_ord')
+    return ((None, deadline), (('project', task.get('project_id')), deadline),
+            (('assignee', task.get('assignee_id')), deadline))
+
+
+def _listing_entries(field):
+    # Every task under the same groups as the deadline index, so a task
+    # listing can walk one of them in order from a cursor.
+    def entries(task):
+        value = task.get(field)
+        if value is None:
+            value = NO_DATE
+        return ((None, value), (('project', task.get('project_id')), value),
+                (('assignee', task.get('assignee_id')), value))
+    return entries
+
+
+TASK_SORTED_INDEXES = {
+    'deadline': _open_deadlines,
+    'list_deadline': _listing_entries('deadline_ord'),
+    'list_created_at': _listing_entries('created_at_ord'),
+    'search': lambda t: search_entries(t, TASK_SEARCH_FIELDS),
+}
+
+TOKEN_INDEXES = {
+    'user_project': lambda t: ((t.get('user_id'), t.get('project_id')),) if t.get('user_id') else (),
+    'used': lambda t: (bool(t.get('used')),),
+}
+
+TOKEN_SORTED_INDEXES = {
+    'expires_at': lambda t: ((None, t.get('expires_at')),),
+}
+
+LOGIN_ATTEMPT_SORTED_INDEXES = {
+    'last_failure': lambda a: ((None, a['failures'][-1] if a.get('failures') else None),),
+}
+
+SESSION_INDEXES = {
+    'user_id': lambda s: (s.get('user_id'),),
+}
+
+SESSION_SORTED_INDEXES = {
+    'expires_at': lambda s: ((None, s.get('expires_at')),),
+}
+
+_collections = {}
+_collections_lock = threading.Lock()
+
+
+def _collection_options(file_path):
+    return {
+        os.path.abspath(app_config.USERS_DB): {
+            'indexes': USER_INDEXES,
+        },
+        os.path.abspath(app_config.PROJECTS_DB): {
+            'indexes': PROJECT_INDEXES,
+            'sorted_indexes': PROJECT_SORTED_INDEXES,
+            'normalize': lambda p: add_date_ordinals(p, PROJECT_DATE_FIELDS),
+        },
+        os.path.abspath(app_config.TASKS_DB): {
+            'indexes': TASK_INDEXES,
+            'sorted_indexes': TASK_SORTED_INDEXES,
+            'normalize': lambda t: add_date_ordinals(t, TASK_DATE_FIELDS),
+        },
+        os.path.abspath(app_config.TOKENS_DB): {
+            'indexes': TOKEN_INDEXES,
+            'sorted_indexes': TOKEN_SORTED_INDEXES,
+        },
+        os.path.abspath(app_config.LOGIN_ATTEMPTS_DB): {
+            'sorted_indexes': LOGIN_ATTEMPT_SORTED_INDEXES,
+        },
+        os.path.abspath(app_config.SESSIONS_DB): {
+            'indexes': SESSION_INDEXES,
+            'sorted_indexes': SESSION_SORTED_INDEXES,
+        },
+    }.get(file_path, {})
+
+
+def create_backend(file_path, backend=None):
+    backend = backend or app_config.STORAGE_BACKEND
+    if backend == 'sqlite':
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        return SqliteBackend(app_config.SQLITE_DB, name)
+    if backend == 'json':
+        return JsonBackend(file_path)
+    raise ValueError('Неизвестный тип хранилища: %s' % backend)
+
+
+def get_collection(file_path):
+    file_path = os.path.abspath(file_path)
+    with _collections_lock:
+        collection = _collections.get(file_path)
+        if collection is None:
+            collection = Collection(create_backend(file_path), **_collection_options(file_path))
+            _collections[file_path] = collection
+        return collection
+
+
+class Database:
+    @property
+    def users(self):
+        return get_collection(app_config.USERS_DB)
+
+    @property
+    def projects(self):
+        return get_collection(app_config.PROJECTS_DB)
+
+    @property
+    def tasks(self):
+        return get_collection(app_config.TASKS_DB)
+
+    @property
+    def tokens(self):
+        return get_collection(app_config.TOKENS_DB)
+
+    @property
+    def directions(self):
+        return get_collection(app_config.DIRECTIONS_DB)
+
+    @property
+    def upload_sessions(self):
+        return get_collection(app_config.UPLOAD_SESSIONS_DB)
+
+    @property
+    def login_attempts(self):
+        return get_collection(app_config.LOGIN_ATTEMPTS_DB)
+
+    @property
+    def sessions(self):
+        return get_collection(app_config.SESSIONS_DB)
+
+    def collections(self):
+        return [self.users, self.projects, self.tasks, self.tokens, self.directions, self.upload_sessions,
+                self.login_attempts, self.sessions]
+
+    def collection_paths(self):
+        return [app_config.USERS_DB, app_config.PROJECTS_DB, app_config.TASKS_DB,
+                app_config.TOKENS_DB, app_config.DIRECTIONS_DB, app_config.UPLOAD_SESSIONS_DB,
+                app_config.LOGIN_ATTEMPTS_DB, app_config.SESSIONS_DB]
+
+
+db = Database()
+
+
+def load_data(file_path):
+    return [clone(r) for r in get_collection(file_path).all()]
+
+
+def save_data(file_path, data):
+    get_collection(file_path).replace_all(data)
+
+
+def migrate_json_to_sqlite():
+    counts = {}
+    for file_path in db.collection_paths():
+        source = Collection(create_backend(file_path, 'json'))
+        target = Collection(create_backend(file_path, 'sqlite'))
+        records = source.all()
+        target.replace_all(records)
+        counts[os.path.basename(file_path)] = len(records)
+    return counts
+
+
+def migrate_date_ordinals():
+    # Fills in <field>_ord for records written before ordinals were stored;
+    # modify() runs the collection's normalizer on each of them.
+    counts = {}
+    for name, fields in (('tasks', TASK_DATE_FIELDS), ('projects', PROJECT_DATE_FIELDS)):
+        collection = getattr(db, name)
+        stale = collection.filter(lambda r: needs_date_ordinals(r, fields))
+        with collection.transaction() as tx:
+            for record in stale:
+                tx.modify(record['id'], lambda r: None)
+        counts[name] = len(stale)
+    return counts
@@ -0,0 +1,113 @@
+import re
+from functools import lru_cache
+
+PROJECT_SEARCH_FIELDS = ['name', 'description', 'expected_result']
+TASK_SEARCH_FIELDS = ['title', 'description']
+MIN_TERM_LENGTH = 2
+
+STOP_WORDS = {
+    'и', 'в', 'во', 'не', 'что', 'он', 'на', 'я', 'с', 'со', 'как', 'а', 'то', 'все', 'она', 'так', 'его',
+    'но', 'да', 'ты', 'к', 'у', 'же', 'вы', 'за', 'бы', 'по', 'ее', 'мне', 'было', 'вот', 'от', 'меня',
+    'еще', 'нет', 'о', 'из', 'ему', 'ли', 'если', 'уже', 'или', 'ни', 'быть', 'был', 'до', 'вас', 'для',
+    'мы', 'их', 'при', 'это', 'этот', 'эти', 'без', 'под', 'над', 'об', 'про', 'the', 'and', 'of', 'to',
+    'in', 'for', 'on', 'is',
+}
+
+WORD_RE = re.compile(r'[^\W_]+')
+
+# Snowball stemmer for Russian, applied to the part of the word after the
+# first vowel (RV). Endings marked with (?<=[ая]) only count after а or я.
+VOWELS = 'аеиоуыэюя'
+RV_RE = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+PERFECTIVE_GERUND_RE = re.compile(r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+REFLEXIVE_RE = re.compile(r'(с[яь])$')
+ADJECTIVE_RE = re.compile(r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$')
+PARTICIPLE_RE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB_RE = re.compile(r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|'
+                     r'ить|ыть|ишь|ую|ю)|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$')
+NOUN_RE = re.compile(r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|'
+                     r'ию|ью|ю|ия|ья|я)$')
+SUPERLATIVE_RE = re.compile(r'(ейше|ейш)$')
+
+
+def _region(word, start):
+    # Start of the region after the first non-vowel that follows a vowel.
+    for i in range(start + 1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            return i + 1
+    return len(word)
+
+
+@lru_cache(maxsize=65536)
+def stem(word):
+    match = RV_RE.match(word)
+    if not match:
+        return word
+    prefix, rv = match.groups()
+
+    stripped = PERFECTIVE_GERUND_RE.sub('', rv, 1)
+    if stripped != rv:
+        rv = stripped
+    else:
+        rv = REFLEXIVE_RE.sub('', rv, 1)
+        stripped = ADJECTIVE_RE.sub('', rv, 1)
+        if stripped != rv:
+            rv = PARTICIPLE_RE.sub('', stripped, 1)
+        else:
+            stripped = VERB_RE.sub('', rv, 1)
+            rv = stripped if stripped != rv else NOUN_RE.sub('', rv, 1)
+
+    if rv.endswith('и'):
+        rv = rv[:-1]
+    r2 = _region(word, _region(word, 0)) - len(prefix)
+    for ending in ('ость', 'ост'):
+        if rv.endswith(ending) and len(rv) - len(ending) >= r2:
+            rv = rv[:-len(ending)]
+            break
+    if rv.endswith('ь'):
+        rv = rv[:-1]
+    else:
+        rv = SUPERLATIVE_RE.sub('', rv, 1)
+        if rv.endswith('нн'):
+            rv = rv[:-1]
+    return prefix + rv
+
+
+def tokenize(text):
+    if not text or not isinstance(text, str):
+        return []
+    return WORD_RE.findall(text.lower().replace('ё', 'е'))
+
+
+def index_terms(text):
+    terms = set()
+    for word in tokenize(text):
+        if word in STOP_WORDS:
+            continue
+        term = stem(word)
+        if len(term) >= MIN_TERM_LENGTH:
+            terms.add(term)
+    return terms
+
+
+def query_terms(text):
+    # A query word may be cut short while the user is typing, so its stem
+    # is matched as a prefix of the indexed terms. For the same reason the
+    # last word is kept even if it is a stop word.
+    words = tokenize(text)
+    terms = []
+    for i, word in enumerate(words):
+        if len(word) < MIN_TERM_LENGTH or (word in STOP_WORDS and i < len(words) - 1):
+            continue
+        term = stem(word)
+        if len(term) < MIN_TERM_LENGTH:
+            term = word
+        if term not in terms:
+            terms.append(term)
+    return terms
+
+
+def search_entries(record, fields):
+    # Sorted index entries grouped by field and the first letters of the
+    # term, so a prefix lookup bisects one short list.
+    return [((field, term[:MIN_TERM_LENGTH]), term) for field in fields for term in index_terms(record.get(field))]
@@ -0,0 +1,225 @@
+import csv
+import io
+import uuid
+from datetime import datetime
+from app.storage import db
+from app.history import get_history_log
+from app.serialization import dumps, loads
+from app.dates import parse_date
+from app.stats import TASK_STATUSES
+
+PROJECT_FIELDS = ['id', 'name', 'description', 'direction', 'expected_result', 'start_date', 'end_date',
+                  'last_activity', 'status', 'supervisor_id', 'manager_id', 'team']
+TASK_FIELDS = ['id', 'project_id', 'title', 'description', 'assignee_id', 'created_by', 'created_at',
+               'start_date', 'deadline', 'status', 'completion_date', 'history']
+EXPORT_FIELDS = {'projects': PROJECT_FIELDS, 'tasks': TASK_FIELDS}
+FORMATS = ['jsonl', 'csv']
+IMPORT_BATCH_SIZE = 1000
+MAX_IMPORT_ERRORS = 100
+
+
+class ImportFailed(Exception):
+    def __init__(self, errors):
+        super().__init__('Импорт отменен')
+        self.errors = errors
+
+
+def _export_record(kind, record):
+    item = {field: record.get(field) for field in EXPORT_FIELDS[kind] if field != 'history'}
+    if kind == 'tasks':
+        history, _ = get_history_log().read(record['id'], 0, None)
+        item['history'] = history
+    return item
+
+
+def export_records(kind, fmt, project_ids=None):
+    # Yields the export line by line so the response and the output file
+    # never hold more than one record.
+    if kind == 'projects':
+        records = db.projects.all() if project_ids is None else db.projects.get_many(project_ids)
+    else:
+        if project_ids is None:
+            records = db.tasks.all()
+        else:
+            task_ids = set()
+            for project_id in project_ids:
+                task_ids |= db.tasks.lookup_ids('project_id', project_id)
+            records = db.tasks.get_many(task_ids)
+
+    if fmt == 'jsonl':
+        for record in records:
+            yield dumps(_export_record(kind, record)).decode('utf-8') + '\n'
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS[kind])
+    writer.writeheader()
+    for record in records:
+        item = _export_record(kind, record)
+        if kind == 'projects':
+            item['team'] = ';'.join(item['team'] or [])
+        else:
+            item['history'] = dumps(item['history']).decode('utf-8') if item['history'] else ''
+        writer.writerow(item)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _parse_rows(fmt, stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'jsonl':
+        for line_number, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, loads(line)
+            except ValueError:
+                yield line_number, None
+        return
+    reader = csv.DictReader(text)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _normalize_csv(kind, row):
+    row = {k: v for k, v in row.items() if k in EXPORT_FIELDS[kind] and v not in (None, '')}
+    if kind == 'projects':
+        row['team'] = [u for u in row.get('team', '').split(';') if u]
+    elif row.get('history'):
+        row['history'] = loads(row['history'])
+    return row
+
+
+def _check_types(kind, row):
+    # Runs before any lookup: values of the wrong type would otherwise fail
+    # in the set lookups below instead of producing a line error.
+    if row.get('id') is not None and (isinstance(row['id'], bool) or not isinstance(row['id'], (str, int))):
+        return 'некорректный идентификатор'
+    for field in EXPORT_FIELDS[kind]:
+        if field in ('id', 'team', 'history') or row.get(field) is None:
+            continue
+        if not isinstance(row[field], str):
+            return f'поле {field} должно быть строкой'
+    team = row.get('team')
+    if team is not None and (not isinstance(team, list) or not all(isinstance(u, str) for u in team)):
+        return 'состав команды должен быть списком идентификаторов'
+    return None
+
+
+def _validate_project(row, users, existing):
+    if not row.get('name'):
+        return 'не указано название проекта'
+    for field in ('manager_id', 'supervisor_id'):
+        if row.get(field) and row[field] not in users and row[field] != existing.get(field):
+            return f'пользователь {row[field]} не найден'
+    unknown = [u for u in row.get('team') or [] if u not in users and u not in (existing.get('team') or [])]
+    if unknown:
+        return f'участники не найдены: {", ".join(unknown)}'
+    for field in ('start_date', 'end_date', 'last_activity'):
+        if row.get(field) and not parse_date(row[field]):
+            return f'некорректная дата в поле {field}'
+    return None
+
+
+def _validate_task(row, users, projects, existing):
+    # References already stored on the record are accepted as they are, so
+    # an export can be imported back even if it points at deleted users.
+    if not row.get('title'):
+        return 'не указано название задачи'
+    if row.get('project_id') not in projects and row.get('project_id') != existing.get('project_id'):
+        return f'проект {row.get("project_id")} не найден'
+    if row.get('assignee_id') and row['assignee_id'] not in users and row['assignee_id'] != existing.get('assignee_id'):
+        return f'пользователь {row["assignee_id"]} не найден'
+    if row.get('status', 'активна') not in TASK_STATUSES:
+        return f'недопустимый статус {row["status"]}'
+    for field in ('created_at', 'start_date', 'deadline', 'completion_date'):
+        if row.get(field) and not parse_date(row[field]):
+            return f'некорректная дата в поле {field}'
+    history = row.get('history') or []
+    if not isinstance(history, list) or not all(isinstance(entry, dict) for entry in history):
+        return 'история должна быть списком записей'
+    return None
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_records(kind, fmt, stream, imported_by=None):
+    # Validates the whole input batch by batch and writes nothing unless
+    # every row is valid; the collection is then committed in a single
+    # transaction and the task history in a single log append.
+    users = db.users.ids()
+    projects = db.projects.ids()
+    collection = db.projects if kind == 'projects' else db.tasks
+    records = []
+    history = []
+    errors = []
+    moved_from = set()
+    now = datetime.now().strftime("%d/%m/%Y")
+
+    for batch in _batches(_parse_rows(fmt, stream), IMPORT_BATCH_SIZE):
+        for line, row in batch:
+            try:
+                if row is not None and fmt == 'csv':
+                    row = _normalize_csv(kind, row)
+            except ValueError:
+                row = None
+            if not isinstance(row, dict):
+                errors.append({'line': line, 'error': 'не удалось разобрать строку'})
+                continue
+
+            error = _check_types(kind, row)
+            existing = None
+            if not error:
+                existing = collection.get_by_id(str(row['id'])) if row.get('id') else None
+                if kind == 'projects':
+                    error = _validate_project(row, users, existing or {})
+                else:
+                    error = _validate_task(row, users, projects, existing or {})
+            if error:
+                errors.append({'line': line, 'error': error})
+                if len(errors) >= MAX_IMPORT_ERRORS:
+                    raise ImportFailed(errors)
+                continue
+
+            record = {field: row.get(field) for field in EXPORT_FIELDS[kind] if field in row and field != 'history'}
+            record['id'] = str(record.get('id') or str(uuid.uuid4())[:8])
+            if existing:
+                # Re-importing updates the exported fields and keeps the rest
+                # (attachments, history already in the log).
+                if kind == 'tasks' and existing.get('project_id') and existing['project_id'] != record.get('project_id', existing['project_id']):
+                    moved_from.add(existing['project_id'])
+                records.append(dict(existing, **record))
+                continue
+            if kind == 'projects':
+                record.setdefault('status', 'в работе')
+                record.setdefault('last_activity', now)
+                record.setdefault('team', [])
+            else:
+                record.setdefault('status', 'активна')
+                record.setdefault('created_at', now)
+                record.setdefault('created_by', imported_by)
+                history.extend(dict(entry, task_id=record['id']) for entry in row.get('history') or [])
+            records.append(record)
+
+    if errors:
+        raise ImportFailed(errors)
+
+    collection.insert_many(records)
+    get_history_log().append(history)
+    if kind == 'tasks':
+        # Like the task forms, record the activity on the affected projects,
+        # including the ones a re-imported task was moved away from.
+        with db.projects.transaction() as tx:
+            for project_id in {record['project_id'] for record in records} | moved_from:
+                tx.update(project_id, {'last_activity': now})
+    return len(records)
@@ -0,0 +1,288 @@
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+from flask import request, send_file, make_response
+from werkzeug.utils import secure_filename
+from config import Config
+from app.storage import db
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+app_config = Config()
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+# Running hashes of chunked uploads in this process, keyed by session id.
+# A chunk that arrives at another worker simply falls back to hashing the
+# assembled file on completion.
+_hashers = {}
+_hashers_lock = threading.Lock()
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.offset = offset
+
+
+def upload_path(name):
+    return os.path.join(app_config.BASE_DIR, 'uploads', name)
+
+
+def blob_name(sha256):
+    return os.path.join('blobs', sha256[:2], sha256)
+
+
+def blob_path(sha256):
+    return upload_path(blob_name(sha256))
+
+
+def attachment_name(file_info):
+    # Attachments uploaded before the content-addressed store keep their
+    # original per-task file.
+    if file_info.get('sha256'):
+        return blob_name(file_info['sha256'])
+    return file_info['unique_filename']
+
+
+def claim_blob(sha256, size):
+    if not SHA256_RE.match(sha256 or ''):
+        return False
+    try:
+        if os.path.getsize(blob_path(sha256)) != size:
+            return False
+        os.utime(blob_path(sha256))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def store_blob(tmp_path, sha256):
+    path = blob_path(sha256)
+    if os.path.exists(path):
+        os.remove(tmp_path)
+        # Refresh the mtime so the garbage collector's grace period covers
+        # a blob that is about to gain a new reference.
+        os.utime(path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+    return path
+
+
+def hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(app_config.UPLOAD_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def save_stream(stream):
+    tmp_path = upload_path('.incoming.%s' % uuid.uuid4().hex)
+    hasher = hashlib.sha256()
+    size = 0
+    with open(tmp_path, 'wb') as f:
+        for chunk in iter(lambda: stream.read(app_config.UPLOAD_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+            f.write(chunk)
+            size += len(chunk)
+    sha256 = hasher.hexdigest()
+    store_blob(tmp_path, sha256)
+    return sha256, size
+
+
+def make_file_info(task_id, filename, sha256, size, uploaded_by):
+    filename = secure_filename(filename)
+    return {
+        'filename': filename,
+        'unique_filename': f"{task_id}_{uuid.uuid4().hex[:8]}_{filename}",
+        'sha256': sha256,
+        'uploaded_by': uploaded_by,
+        'uploaded_at': datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
+        'size': size
+    }
+
+
+def attach_file(task_id, file_info):
+    def append_file(record):
+        record['files'] = record.get('files', []) + [file_info]
+
+    if not db.tasks.modify(task_id, append_file):
+        raise UploadError('Задача не найдена', 404)
+    return file_info
+
+
+def part_path(session):
+    return upload_path(session['unique_filename'] + '.part')
+
+
+def received_bytes(session):
+    # The partial file is appended to in place, so its size is the resume
+    # offset even when the previous request broke off mid-chunk.
+    try:
+        return os.path.getsize(part_path(session))
+    except FileNotFoundError:
+        return 0
+
+
+def _discard_session(session):
+    with _hashers_lock:
+        _hashers.pop(session['id'], None)
+    if os.path.exists(part_path(session)):
+        os.remove(part_path(session))
+
+
+def purge_expired_sessions():
+    deadline = time.time() - app_config.UPLOAD_SESSION_TTL
+    expired = db.upload_sessions.filter(lambda s: s.get('created_at', 0) < deadline)
+    if not expired:
+        return 0
+    with db.upload_sessions.transaction() as tx:
+        for session in expired:
+            tx.delete(session['id'])
+    for session in expired:
+        _discard_session(session)
+    return len(expired)
+
+
+def create_session(task_id, user_id, filename, size):
+    purge_expired_sessions()
+    if size > app_config.MAX_UPLOAD_SIZE:
+        raise UploadError('Файл превышает допустимый размер', 413)
+    filename = secure_filename(filename)
+    session = {
+        'id': uuid.uuid4().hex,
+        'task_id': task_id,
+        'user_id': user_id,
+        'filename': filename,
+        'unique_filename': f"{task_id}_{uuid.uuid4().hex[:8]}_{filename}",
+        'size': size,
+        'created_at': time.time(),
+    }
+    os.makedirs(os.path.dirname(part_path(session)), exist_ok=True)
+    open(part_path(session), 'wb').close()
+    return db.upload_sessions.insert(session)
+
+
+def write_chunk(session, content_range, stream):
+    match = CONTENT_RANGE_RE.match(content_range or '')
+    if not match:
+        raise UploadError('Некорректный заголовок Content-Range')
+    start, end, total = (int(v) for v in match.groups())
+    if total != session['size'] or end < start or end >= total:
+        raise UploadError('Диапазон не соответствует размеру файла')
+
+    with open(part_path(session), 'ab') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        offset = f.seek(0, os.SEEK_END)
+        if start != offset:
+            raise UploadError('Ожидается фрагмент с другой позиции', 409, offset)
+
+        with _hashers_lock:
+            state = _hashers.pop(session['id'], None)
+        if state and state[0] == start:
+            hasher = state[1]
+        else:
+            hasher = hashlib.sha256() if start == 0 else None
+
+        remaining = end - start + 1
+        while remaining:
+            chunk = stream.read(min(app_config.UPLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            f.write(chunk)
+            if hasher is not None:
+                hasher.update(chunk)
+            remaining -= len(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+        offset = f.tell()
+
+    if hasher is not None:
+        with _hashers_lock:
+            _hashers[session['id']] = (offset, hasher)
+    return offset
+
+
+def finalize_session(session, uploaded_by):
+    if received_bytes(session) != session['size']:
+        raise UploadError('Файл загружен не полностью', 409, received_bytes(session))
+
+    with _hashers_lock:
+        state = _hashers.pop(session['id'], None)
+    if state and state[0] == session['size']:
+        sha256 = state[1].hexdigest()
+    else:
+        sha256 = hash_file(part_path(session))
+    store_blob(part_path(session), sha256)
+
+    db.upload_sessions.delete(session['id'])
+    file_info = make_file_info(session['task_id'], session['filename'], sha256, session['size'], uploaded_by)
+    file_info['unique_filename'] = session['unique_filename']
+    return attach_file(session['task_id'], file_info)
+
+
+def cancel_session(session):
+    db.upload_sessions.delete(session['id'])
+    _discard_session(session)
+
+
+def collect_garbage(grace_period=3600):
+    # A blob is kept while any task references it. Fresh blobs are skipped
+    # so an upload that is just being attached is not removed under it.
+    removed = 0
+    freed = 0
+    now = time.time()
+    for root, _, files in os.walk(upload_path('blobs')):
+        for name in files:
+            path = os.path.join(root, name)
+            if not SHA256_RE.match(name) or db.tasks.count('sha256', name):
+                continue
+            stat = os.stat(path)
+            if now - stat.st_mtime < grace_period:
+                continue
+            os.remove(path)
+            removed += 1
+            freed += stat.st_size
+    return removed, freed
+
+
+def send_attachment(file_info):
+    name = attachment_name(file_info)
+    filepath = upload_path(name)
+    if not os.path.exists(filepath):
+        return None
+    etag = '%s-%s' % (file_info.get('size'), file_info.get('uploaded_at'))
+    try:
+        last_modified = datetime.strptime(file_info.get('uploaded_at', ''), "%d/%m/%Y %H:%M:%S")
+    except ValueError:
+        last_modified = None
+
+    if app_config.SENDFILE_MODE == 'x-accel-redirect':
+        # nginx serves the bytes (including Range) from an internal location
+        # mapped onto the uploads directory.
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = app_config.X_ACCEL_PREFIX + name.replace(os.sep, '/')
+        response.headers['Content-Disposition'] = 'attachment; filename="%s"' % file_info['filename']
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.make_conditional(request)
+    else:
+        # send_file handles Range and conditional requests itself and sets
+        # X-Sendfile when USE_X_SENDFILE is enabled.
+        response = send_file(filepath, as_attachment=True, download_name=file_info['filename'],
+                             etag=etag, last_modified=last_modified, conditional=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
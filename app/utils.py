@@ -1,68 +1,60 @@
 import json
 import os
+import base64
+import hashlib
+import time
 import uuid
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from config import Config
-from dateutil.parser import parse as parse_date
+from flask import g, request, jsonify, make_response
 from flask_login import current_user
+from app.storage import db, load_data, save_data, migrate_date_ordinals
+from app.history import get_history_log, migrate_task_history
+from app.security import hash_password
+from app.sessions import cached_access_context, cache_access_context
 
 app_config = Config()
 
 def init_database(force_recreate=False):
     if force_recreate:
         print("Принудительное пересоздание базы данных...")
-        if os.path.exists(app_config.USERS_DB):
-            os.remove(app_config.USERS_DB)
-        if os.path.exists(app_config.PROJECTS_DB):
-            os.remove(app_config.PROJECTS_DB)
-        if os.path.exists(app_config.TASKS_DB):
-            os.remove(app_config.TASKS_DB)
-        if os.path.exists(app_config.TOKENS_DB):
-            os.remove(app_config.TOKENS_DB)
-        if os.path.exists(app_config.DIRECTIONS_DB):
-            os.remove(app_config.DIRECTIONS_DB)
-
-    if not os.path.exists(app_config.USERS_DB):
+        for collection in db.collections():
+            collection.drop()
+        get_history_log().drop()
+
+    if not db.users.exists():
         print("Создание файла пользователей...")
         users = [
             {
                 "id": "1",
                 "username": "admin",
-                "password": generate_password_hash("admin", method='pbkdf2:sha256', salt_length=8),
+                "password": hash_password("admin"),
                 "name": "Администратор системы",
                 "role": "admin",
                 "token": "ADMIN001",
                 "projects": []
             }
         ]
-        with open(app_config.USERS_DB, 'w', encoding='utf-8') as f:
-            json.dump(users, f, ensure_ascii=False, indent=2)
+        db.users.replace_all(users)
         print("Файл пользователей создан успешно")
     
-    if not os.path.exists(app_config.PROJECTS_DB):
+    if not db.projects.exists():
         print("Создание файла проектов...")
-        projects = []
-        with open(app_config.PROJECTS_DB, 'w', encoding='utf-8') as f:
-            json.dump(projects, f, ensure_ascii=False, indent=2)
+        db.projects.replace_all([])
         print("Файл проектов создан успешно")
     
-    if not os.path.exists(app_config.TASKS_DB):
+    if not db.tasks.exists():
         print("Создание файла задач...")
-        tasks = []
-        with open(app_config.TASKS_DB, 'w', encoding='utf-8') as f:
-            json.dump(tasks, f, ensure_ascii=False, indent=2)
+        db.tasks.replace_all([])
         print("Файл задач создан успешно")
     
-    if not os.path.exists(app_config.TOKENS_DB):
+    if not db.tokens.exists():
         print("Создание файла токенов...")
-        tokens = []
-        with open(app_config.TOKENS_DB, 'w', encoding='utf-8') as f:
-            json.dump(tokens, f, ensure_ascii=False, indent=2)
+        db.tokens.replace_all([])
         print("Файл токенов создан успешно")
     
-    if not os.path.exists(app_config.DIRECTIONS_DB):
+    if not db.directions.exists():
         print("Создание файла направлений...")
         directions = [
             {"id": "1", "name": "Информационные технологии"},
@@ -71,67 +63,107 @@ def init_database(force_recreate=False):
             {"id": "4", "name": "Строительство"},
             {"id": "5", "name": "Образование"}
         ]
-        with open(app_config.DIRECTIONS_DB, 'w', encoding='utf-8') as f:
-            json.dump(directions, f, ensure_ascii=False, indent=2)
+        db.directions.replace_all(directions)
         print("Файл направлений создан успешно")
 
+    migrated = migrate_date_ordinals()
+    if any(migrated.values()):
+        print(f"Добавлены числовые даты: задачи - {migrated['tasks']}, проекты - {migrated['projects']}")
 
-def load_data(file_path):
-    if not os.path.exists(file_path):
-        return []
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-
-def save_data(file_path, data):
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    if db.tasks.first(lambda t: 'history' in t):
+        print("Перенос истории задач в журнал...")
+        print(f"Перенесено записей истории: {migrate_task_history()}")
 
 
 def load_directions():
-    return load_data(app_config.DIRECTIONS_DB)
+    return db.directions.all()
 
 
 def save_directions(directions):
-    save_data(app_config.DIRECTIONS_DB, directions)
+    db.directions.replace_all(directions)
+
+
+class AccessContext:
+    def __init__(self, user):
+        self.user_id = user.id
+        self.is_admin = user.role == 'admin'
+        self.version = _access_version(user)
+        
+        if user.role == 'manager':
+            self.project_ids = db.projects.lookup_ids('manager_id', user.id) | db.projects.lookup_ids('supervisor_id', user.id)
+        elif user.role == 'supervisor':
+            self.project_ids = db.projects.lookup_ids('supervisor_id', user.id)
+        else:
+            self.project_ids = db.projects.lookup_ids('team', user.id)
+        
+        self.task_ids = db.tasks.lookup_ids('assignee_id', user.id)
+    
+    def can_access_project(self, project_id):
+        return self.is_admin or project_id in self.project_ids
+    
+    def can_access_task(self, task_id):
+        if self.is_admin or task_id in self.task_ids:
+            return True
+        task = db.tasks.get_by_id(task_id)
+        return task is not None and task.get('project_id', '') in self.project_ids
+
+
+def _access_version(user):
+    return (user.id, user.role, db.projects.version, db.tasks.version)
+
+
+def get_access_context():
+    version = _access_version(current_user)
+    context = g.get('access_context')
+    if context is None or context.version != version:
+        context = cached_access_context(version)
+        if context is None:
+            context = AccessContext(current_user)
+            cache_access_context(context)
+        g.access_context = context
+    return context
 
 
 def can_access_task(task_id):
-    if current_user.role == 'admin':
-        return True
-    
-    tasks = load_data(app_config.TASKS_DB)
-    task = next((t for t in tasks if t.get('id') == task_id), None)
-    
-    if not task:
-        return False
-    
-    if task.get('assignee_id') == current_user.id:
-        return True
-    
-    return can_access_project(task.get('project_id', ''))
+    return get_access_context().can_access_task(task_id)
 
 
 def can_access_project(project_id):
+    return get_access_context().can_access_project(project_id)
+
+
+def get_visible_projects():
     if current_user.role == 'admin':
-        return True
+        return db.projects.all()
     
-    projects = load_data(app_config.PROJECTS_DB)
-    project = next((p for p in projects if p.get('id') == project_id), None)
-    
-    if not project:
-        return False
-    
-    if current_user.role == 'manager' and (project.get('manager_id', '') == current_user.id or project.get('supervisor_id', '') == current_user.id):
-        return True
-    
-    if current_user.role == 'supervisor' and project.get('supervisor_id', '') == current_user.id:
-        return True
-    
-    if current_user.role == 'worker' and current_user.id in project.get('team', []):
+    return db.projects.get_many(get_access_context().project_ids)
+
+
+def get_project_tasks(project_ids):
+    task_ids = set()
+    for project_id in project_ids:
+        task_ids |= db.tasks.lookup_ids('project_id', project_id)
+    return db.tasks.get_many(task_ids)
+
+
+def _change_team(project_id, user_id, add):
+    # The membership check and the write happen under the collection's
+    # write lock, so concurrent changes to the same team are not lost.
+    with db.projects.transaction() as tx:
+        project = tx.get_by_id(project_id)
+        if project is None or (user_id in project.get('team', [])) == add:
+            return False
+        team = [m for m in project.get('team', []) if m != user_id]
+        tx.update(project_id, {'team': team + [user_id] if add else team})
         return True
-    
-    return False
+
+
+def add_team_member(project_id, user_id):
+    return _change_team(project_id, user_id, True)
+
+
+def remove_team_member(project_id, user_id):
+    return _change_team(project_id, user_id, False)
 
 
 def get_available_roles():
@@ -144,15 +176,14 @@ def get_available_roles():
 
 
 def load_tokens():
-    if not os.path.exists(app_config.TOKENS_DB):
-        return []
-    with open(app_config.TOKENS_DB, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return db.tokens.all()
 
 
 def save_tokens(tokens):
-    with open(app_config.TOKENS_DB, 'w', encoding='utf-8') as f:
-        json.dump(tokens, f, ensure_ascii=False, indent=2)
+    db.tokens.replace_all(tokens)
+
+
+_last_token_purge = 0
 
 
 def generate_token(role, project_id=None):
@@ -161,65 +192,137 @@ def generate_token(role, project_id=None):
         'role': role,
         'project_id': project_id,
         'created_at': datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
+        'expires_at': int(time.time()) + app_config.TOKEN_TTL,
         'used': False
     }
-    tokens = load_tokens()
-    tokens.append(token)
-    save_tokens(tokens)
+    db.tokens.insert(token)
+    maybe_purge_tokens()
     return token['id']
 
 
+def _token_is_valid(token):
+    if not token or token['used']:
+        return False
+    return not token.get('expires_at') or token['expires_at'] > time.time()
+
+
 def validate_token(token_id):
-    tokens = load_tokens()
-    token = next((t for t in tokens if t['id'] == token_id), None)
-    if token and not token['used']:
+    token = db.tokens.get_by_id(token_id)
+    if _token_is_valid(token):
         return token
     return None
 
 
 def mark_token_as_used(token_id):
-    tokens = load_tokens()
-    for token in tokens:
-        if token['id'] == token_id:
-            token['used'] = True
-            break
-    save_tokens(tokens)
+    # Checked again under the write lock so that two registrations racing
+    # on the same token cannot both succeed.
+    with db.tokens.transaction() as tx:
+        if not _token_is_valid(tx.get_by_id(token_id)):
+            return False
+        tx.update(token_id, {'used': True, 'used_at': int(time.time())})
+    return True
+
+
+def purge_tokens():
+    # Used tokens and expired invitations are dropped; per-user tokens carry
+    # no expiry and stay until used.
+    now = int(time.time())
+    with db.tokens.transaction() as tx:
+        stale = db.tokens.lookup_ids('used', True)
+        stale.update(t['id'] for _, t in db.tokens.range('expires_at', None, None, now - 1))
+        for token_id in stale:
+            tx.delete(token_id)
+    if stale:
+        db.tokens.compact()
+    return len(stale)
+
+
+def maybe_purge_tokens():
+    global _last_token_purge
+    if time.time() - _last_token_purge >= app_config.TOKEN_PURGE_INTERVAL:
+        _last_token_purge = time.time()
+        purge_tokens()
+
+
+def _find_user_token(user_id, project_id):
+    return next((t for t in db.tokens.lookup('user_project', (user_id, project_id)) if _token_is_valid(t)), None)
+
+
+def get_user_tokens(user_ids, project_id=None):
+    user_ids = list(dict.fromkeys(u for u in user_ids if u))
+    result = {}
+    for user_id in user_ids:
+        existing_token = _find_user_token(user_id, project_id)
+        if existing_token:
+            result[user_id] = existing_token['id']
+    
+    missing = [u for u in user_ids if u not in result]
+    if missing:
+        with db.tokens.transaction() as tx:
+            for user_id in missing:
+                existing_token = _find_user_token(user_id, project_id)
+                if existing_token:
+                    result[user_id] = existing_token['id']
+                    continue
+                token = tx.insert({
+                    'id': str(uuid.uuid4()),
+                    'user_id': user_id,
+                    'project_id': project_id,
+                    'created_at': datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
+                    'used': False
+                })
+                result[user_id] = token['id']
+    
+    return result
 
 
 def get_user_token(user_id, project_id=None):
-    tokens = load_tokens()
-    existing_token = next((t for t in tokens if t.get('user_id') == user_id and t.get('project_id') == project_id and not t['used']), None)
-    
-    if existing_token:
-        return existing_token['id']
-    
-    token = {
-        'id': str(uuid.uuid4()),
-        'user_id': user_id,
-        'project_id': project_id,
-        'created_at': datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
-        'used': False
-    }
-    tokens.append(token)
-    save_tokens(tokens)
-    return token['id']
+    return get_user_tokens([user_id], project_id).get(user_id)
 
 
-def add_task_history(task, action, user_id, users):
-    user = next((u for u in users if u['id'] == user_id), None)
+def history_entry(task_id, action, user_id):
+    user = db.users.get_by_id(user_id)
     user_name = user.get('name', user.get('username', 'Неизвестный')) if user else 'Неизвестный'
-    
-    if 'history' not in task:
-        task['history'] = []
-    
-    history_entry = {
+
+    return {
+        'task_id': task_id,
         'action': action,
         'date': datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
         'user_id': user_id,
         'user_name': user_name
     }
-    
-    task['history'].append(history_entry)
+
+
+def add_task_history(entries):
+    get_history_log().append(entries)
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        return None
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def conditional_json(etag_func, build):
+    # The tag is taken before building, so a concurrent write can only make
+    # the next request miss, never pin a stale body to a fresh tag.
+    etag = etag_func()
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 def allowed_file(filename):
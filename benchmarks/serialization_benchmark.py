@@ -0,0 +1,80 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from app import serialization
+from app.backends import JsonBackend
+
+# Сравнение сохранения, загрузки и jsonify для коллекции задач на stdlib
+# json и orjson, в компактном и форматированном виде.
+#   python benchmarks/serialization_benchmark.py [1000 10000 100000]
+
+SIZES = [1000, 10000, 100000]
+REPEAT = 3
+
+
+def make_tasks(count):
+    return [{
+        'id': '%08x' % i,
+        'project_id': '%08x' % (i % 50),
+        'title': 'Задача %d: подготовка документации' % i,
+        'description': 'Согласовать техническое задание и подготовить отчет по этапу %d' % i,
+        'assignee_id': str(i % 40),
+        'created_by': '1',
+        'created_at': '01/03/2025',
+        'created_at_ord': 739311,
+        'start_date': '2025-03-01',
+        'start_date_ord': 739311,
+        'deadline': '2025-04-%02d' % (i % 28 + 1),
+        'deadline_ord': 739342 + i % 28,
+        'status': ['активна', 'завершена', 'отложена'][i % 3],
+        'completion_date': '',
+        'files': [],
+        'rev': 1,
+    } for i in range(count)]
+
+
+def best_time(func):
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def run(sizes):
+    from app import create_app
+    app = create_app()
+    encoders = [('stdlib', None)]
+    if serialization.orjson is not None:
+        encoders.append(('orjson', serialization.orjson))
+    else:
+        print('orjson не установлен, замеряется только stdlib')
+
+    print('%-8s %-8s %-8s %10s %12s %12s %12s' % ('задач', 'кодек', 'формат', 'файл, КБ', 'запись, мс', 'чтение, мс', 'jsonify, мс'))
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in sizes:
+            tasks = make_tasks(count)
+            for name, module in encoders:
+                serialization.orjson = module
+                for storage_format in ['compact', 'pretty']:
+                    Config.JSON_STORAGE_FORMAT = storage_format
+                    app.json.compact = storage_format == 'compact'
+                    path = os.path.join(tmp, 'tasks-%s-%s-%d.json' % (name, storage_format, count))
+                    save = best_time(lambda: JsonBackend(path).replace(tasks))
+                    load = best_time(lambda: JsonBackend(path).read_changes())
+                    with app.test_request_context():
+                        response = best_time(lambda: app.json.response({'tasks': tasks}).get_data())
+                    print('%-8d %-8s %-8s %10d %12.1f %12.1f %12.1f' % (
+                        count, name, storage_format, os.path.getsize(path) // 1024, save, load, response))
+    serialization.orjson = encoders[-1][1]
+
+
+if __name__ == '__main__':
+    run([int(arg) for arg in sys.argv[1:]] or SIZES)
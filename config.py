@@ -12,3 +12,56 @@ class Config:
     TASKS_DB = os.path.join(DATABASE_PATH, 'tasks.json')
     TOKENS_DB = os.path.join(DATABASE_PATH, 'tokens.json')
     DIRECTIONS_DB = os.path.join(DATABASE_PATH, 'directions.json')
+    UPLOAD_SESSIONS_DB = os.path.join(DATABASE_PATH, 'upload_sessions.json')
+    LOGIN_ATTEMPTS_DB = os.path.join(DATABASE_PATH, 'login_attempts.json')
+    SESSIONS_DB = os.path.join(DATABASE_PATH, 'sessions.json')
+    TASK_HISTORY_LOG = os.path.join(DATABASE_PATH, 'task_history.jsonl')
+
+    JOURNAL_COMPACT_OPS = int(os.environ.get('JOURNAL_COMPACT_OPS', 500))
+    # 'compact' writes the JSON files without whitespace; 'pretty' indents
+    # them for reading by hand while debugging.
+    JSON_STORAGE_FORMAT = os.environ.get('JSON_STORAGE_FORMAT', 'compact')
+
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'json')
+    SQLITE_DB = os.environ.get('SQLITE_DB') or os.path.join(DATABASE_PATH, 'registry.sqlite3')
+
+    USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 5))
+
+    MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', 1024 * 1024 * 1024))
+    UPLOAD_CHUNK_SIZE = 64 * 1024
+    UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL', 24 * 60 * 60))
+
+    # '' serves attachments from Python, 'x-sendfile' (Apache, lighttpd) or
+    # 'x-accel-redirect' (nginx) hands the transfer to the fronting proxy.
+    SENDFILE_MODE = os.environ.get('SENDFILE_MODE', '')
+    USE_X_SENDFILE = SENDFILE_MODE == 'x-sendfile'
+    X_ACCEL_PREFIX = os.environ.get('X_ACCEL_PREFIX', '/protected-uploads/')
+
+    TOKEN_TTL = int(os.environ.get('TOKEN_TTL', 7 * 24 * 60 * 60))
+    TOKEN_PURGE_INTERVAL = int(os.environ.get('TOKEN_PURGE_INTERVAL', 60 * 60))
+
+    # Every stored hash is brought to this policy on the user's next login,
+    # so the cost of a login check is the same for all accounts.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:260000')
+    PASSWORD_SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH', 16))
+
+    LOGIN_ATTEMPT_WINDOW = int(os.environ.get('LOGIN_ATTEMPT_WINDOW', 15 * 60))
+    LOGIN_MAX_ATTEMPTS = int(os.environ.get('LOGIN_MAX_ATTEMPTS', 5))
+    LOGIN_MAX_ATTEMPTS_PER_IP = int(os.environ.get('LOGIN_MAX_ATTEMPTS_PER_IP', 50))
+    LOGIN_MAX_ATTEMPTS_PER_ACCOUNT = int(os.environ.get('LOGIN_MAX_ATTEMPTS_PER_ACCOUNT', 200))
+    LOGIN_ATTEMPT_PURGE_INTERVAL = int(os.environ.get('LOGIN_ATTEMPT_PURGE_INTERVAL', 60 * 60))
+    # Number of reverse proxies in front of the app (e.g. the nginx used for
+    # X-Accel-Redirect). Their X-Forwarded-For entries are trusted, so the
+    # login limits see the client's address instead of the proxy's.
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+
+    # 'cookie' keeps Flask's signed-cookie sessions, 'memory' stores them in
+    # the worker process (single worker only), 'shared' in the sessions
+    # collection that all workers read.
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'shared')
+    SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', 10000))
+    SESSION_REFRESH_INTERVAL = int(os.environ.get('SESSION_REFRESH_INTERVAL', 60 * 60))
+    SESSION_PURGE_INTERVAL = int(os.environ.get('SESSION_PURGE_INTERVAL', 60 * 60))
+
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 1000))
+    FRAGMENT_CACHE_MAX_BYTES = int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES', 64 * 1024 * 1024))